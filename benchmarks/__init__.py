@@ -0,0 +1,14 @@
+"""
+Performance benchmarks for composerstoolkit.
+
+Each benchmark times an operation over synthetic inputs of increasing
+size, giving a scaling curve. Run from the root of the repository with:
+
+    PYTHONPATH=src python -m benchmarks --tier medium --output results.json
+
+and compare a later run against a saved one with --baseline, which
+reports (and exits with status 1 on) any timings that have regressed.
+Baselines are machine specific, so are not kept in the repository.
+"""
+from .runner import BENCHMARKS, TIERS, benchmark, run, compare
+from . import cases
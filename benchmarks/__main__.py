@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+
+from . import BENCHMARKS, TIERS, run, compare
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+        description="Run the composerstoolkit benchmarks")
+    parser.add_argument("names", nargs="*",
+        help="benchmarks to run (prefixes match, eg. 'transformers'); all by default")
+    parser.add_argument("--tier", choices=sorted(TIERS.keys()), default="small",
+        help="range of input sizes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05,
+        help="minimum duration of each measurement, in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare the results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+        help="slowdown (as a fraction) allowed before a timing counts as a regression")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name in sorted(BENCHMARKS.keys()):
+            print(name)
+        return 0
+    names = sorted(n for n in BENCHMARKS.keys()
+        if not args.names or any(n.startswith(prefix) for prefix in args.names))
+    if not names:
+        parser.error("no benchmarks match {}".format(args.names))
+
+    def progress(name, size, seconds):
+        print("{:<45} {:>8} {:>14.6f}s".format(name, size, seconds))
+    results = run(names, args.tier, args.repeat, args.min_time, args.seed, progress)
+
+    if args.output:
+        with open(args.output, "w") as outf:
+            json.dump(results, outf, indent=2)
+    if args.baseline:
+        with open(args.baseline) as inf:
+            baseline = json.load(inf)
+        rows = compare(results, baseline, args.tolerance)
+        print()
+        print("{:<45} {:>8} {:>12} {:>12} {:>8}".format(
+            "benchmark", "size", "baseline", "now", "ratio"))
+        for (name, size, before, after, ratio, regressed) in rows:
+            print("{:<45} {:>8} {:>12.6f} {:>12.6f} {:>8.2f}{}".format(
+                name, size, before, after, ratio, "  REGRESSED" if regressed else ""))
+        if any(row[5] for row in rows):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+The benchmarks. Inputs are synthetic, generated from the random module
+(which the runner seeds before each setup).
+"""
+import os
+import random
+import tempfile
+
+from composerstoolkit import (CTEvent, CTSequence, Container, Vertex,
+chain, boolean_gate, loop, transpose, retrograde, invert, rotate,
+explode_intervals, rhythmic_augmentation, rhythmic_diminution,
+map_to_pulses, map_to_pitches, aggregate_into_chords, cantus,
+random_walk_backtracking, constraint_in_set, constraint_no_leaps_more_than,
+Evolutionary, parse_to_connection_graph, find_matching_nodes, scales)
+
+from .runner import benchmark
+
+def melody(size, low=48, high=84):
+    return CTSequence([
+        CTEvent(random.randint(low, high), random.choice([0.25, 0.5, 1, 2]))
+        for i in range(size)])
+
+def gate(size):
+    return CTSequence([
+        CTEvent(random.choice([None, 0]), random.choice([1, 2, 4]))
+        for i in range(size)])
+
+TRANSFORMERS = {
+    "transpose": lambda size: transpose(2),
+    "invert": lambda size: invert(),
+    "retrograde": lambda size: retrograde(),
+    "rotate": lambda size: rotate(size // 2),
+    "loop": lambda size: loop(4),
+    "explode_intervals": lambda size: explode_intervals(2),
+    "rhythmic_augmentation": lambda size: rhythmic_augmentation(2),
+    "rhythmic_diminution": lambda size: rhythmic_diminution(2),
+    "map_to_pulses": lambda size: map_to_pulses(melody(size)),
+    "map_to_pitches": lambda size: map_to_pitches(melody(size)),
+    "aggregate_into_chords": lambda size: aggregate_into_chords(4, 1),
+}
+
+def _transformer_benchmark(name, make_transformer):
+    @benchmark("transformers." + name, 1000)
+    def setup(size):
+        seq = melody(size)
+        transformer = make_transformer(size)
+        def operation():
+            # materialized, so that lazy results are paid for
+            return list((seq |chain| transformer).events)
+        return operation
+
+for _name, _make_transformer in TRANSFORMERS.items():
+    _transformer_benchmark(_name, _make_transformer)
+
+@benchmark("transformers.chain_of_5", 1000)
+def chain_of_5(size):
+    seq = melody(size)
+    def operation():
+        result = (seq |chain| transpose(2) |chain| invert() |chain| retrograde()
+            |chain| rhythmic_augmentation(2) |chain| transpose(-1))
+        return list(result.events)
+    return operation
+
+@benchmark("boolean_gate", 1000)
+def gated_transpose(size):
+    seq = melody(size)
+    gate_seq = gate(size // 2)
+    def operation():
+        return seq |chain| transpose(2, gate=boolean_gate(gate_seq))
+    return operation
+
+@benchmark("container.get_playback_events", 1000)
+def playback_events(size):
+    container = Container()
+    for voice in range(4):
+        container.add_sequence(voice, melody(size))
+    return container.get_playback_events
+
+@benchmark("container.save_as_midi_file", 1000)
+def save_as_midi_file(size):
+    container = Container()
+    for voice in range(4):
+        container.add_sequence(voice, melody(size))
+    def operation():
+        with tempfile.TemporaryDirectory() as directory:
+            container.save_as_midi_file(os.path.join(directory, "bench.mid"))
+    return operation
+
+@benchmark("solvers.random_walk_backtracking", 16)
+def backtracking(size):
+    constraints = [
+        constraint_in_set(scales.C_major),
+        constraint_no_leaps_more_than(5),
+    ]
+    def operation():
+        return random_walk_backtracking(60, size, constraints)
+    return operation
+
+@benchmark("evolutionary.generations", 8)
+def evolutionary(size):
+    def operation():
+        evo = Evolutionary(
+            transformations=[
+                (transpose(1), 0.5),
+                (transpose(-1), 0.5),
+                (transpose(2), 0.5),
+                (retrograde(), 0.5)],
+            fitness_func=lambda seq: True)
+        return evo(cantus([60, 62, 64, 65]), size)
+    return operation
+
+def _chorale_file(directory, size):
+    """a four voice 'chorale' of size chords, saved as a MIDI file"""
+    container = Container()
+    for voice in range(4):
+        container.add_sequence(0, melody(size, 36 + voice * 12, 48 + voice * 12))
+    filename = os.path.join(directory, "chorale.mid")
+    container.save_as_midi_file(filename)
+    return filename
+
+@benchmark("analysis.parse_to_connection_graph", 16)
+def connection_graph(size):
+    directory = tempfile.TemporaryDirectory()
+    filename = _chorale_file(directory.name, size)
+    def operation():
+        return parse_to_connection_graph(filename)
+    # the file is needed for as long as the operation, and the
+    # directory is removed once both are discarded
+    operation.directory = directory
+    return operation
+
+@benchmark("analysis.find_matching_nodes", 16)
+def matching_nodes(size):
+    with tempfile.TemporaryDirectory() as directory:
+        search_in = Vertex.treeFromGraph(
+            parse_to_connection_graph(_chorale_file(directory, size)))
+        search_for = Vertex.treeFromGraph(
+            parse_to_connection_graph(_chorale_file(directory, 4)))
+    def operation():
+        return find_matching_nodes(search_for, search_in)
+    return operation
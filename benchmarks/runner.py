@@ -0,0 +1,104 @@
+import platform
+import random
+import statistics
+import sys
+import time
+
+# the input sizes of each tier, as multiples of a benchmark's base size
+TIERS = {
+    "small": [1, 2],
+    "medium": [1, 2, 4, 8],
+    "large": [1, 2, 4, 8, 16, 32],
+    "xlarge": [1, 2, 4, 8, 16, 32, 64, 128],
+}
+
+# name -> (base size, setup function)
+BENCHMARKS = {}
+
+def benchmark(name, base_size):
+    """Register setup(size) as the benchmark name. setup builds the
+    synthetic input of the given size, and returns a function taking no
+    arguments, which is the operation timed.
+    """
+    def register(setup):
+        BENCHMARKS[name] = (base_size, setup)
+        return setup
+    return register
+
+def time_operation(operation, repeat=5, min_time=0.05):
+    """Time operation, calling it enough times per measurement to take
+    at least min_time. Returns the per-call timings of each of repeat
+    measurements.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            operation()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number = number * 2
+    timings = [elapsed / number]
+    for i in range(repeat - 1):
+        start = time.perf_counter()
+        for i in range(number):
+            operation()
+        timings.append((time.perf_counter() - start) / number)
+    return timings
+
+def run(names=None, tier="small", repeat=5, min_time=0.05, seed=0, progress=None):
+    """Run the named benchmarks (or all of them) at each size of the
+    tier, returning the results as a JSON-serializable dict
+    """
+    if names is None:
+        names = sorted(BENCHMARKS.keys())
+    results = {}
+    for name in names:
+        base_size, setup = BENCHMARKS[name]
+        results[name] = {}
+        for multiple in TIERS[tier]:
+            size = base_size * multiple
+            # inputs (and any random choices they make) are reproducible
+            random.seed(seed)
+            operation = setup(size)
+            timings = time_operation(operation, repeat, min_time)
+            results[name][str(size)] = {
+                "min": min(timings),
+                "median": statistics.median(timings),
+                "repeat": repeat,
+            }
+            if progress is not None:
+                progress(name, size, min(timings))
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "tier": tier,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+def compare(results, baseline, tolerance=0.25):
+    """Compare the min timing of each benchmark and size present in
+    both results and baseline. Returns a list of (name, size, baseline
+    time, time, ratio, regressed) tuples, where regressed means that
+    the ratio exceeds 1 + tolerance.
+    """
+    rows = []
+    for name, sizes in sorted(results["results"].items()):
+        try:
+            baseline_sizes = baseline["results"][name]
+        except KeyError:
+            continue
+        for size, timing in sorted(sizes.items(), key=lambda x: int(x[0])):
+            try:
+                before = baseline_sizes[size]["min"]
+            except KeyError:
+                continue
+            after = timing["min"]
+            ratio = after / before if before > 0 else float("inf")
+            rows.append((name, int(size), before, after, ratio, ratio > 1 + tolerance))
+    return rows
@@ -7,7 +7,20 @@ invert, rotate, mutation, explode_intervals, rhythmic_augmentation,
 rhythmic_diminution, map_to_pulses, map_to_pitches, aggregate_into_chords)
 from .core import (NotChainableException, chain, CTEvent,
 CTSequence, CTGenerator, CTTransformer, boolean_gate, Container, 
-midievent, Vertex)
+midievent, Vertex, set_history_policy, iter_midi_events,
+set_transform_cache, TransformCache, set_profiler)
+from .batch import render_midi_files, RenderResult
+from .columnar import ColumnarEvents
+from .history import (KeepAll, NoHistory, KeepLast, WeakHistory,
+DeltaHistory)
+from .instrumentation import Profiler, TransformerStats
+from .lazy import LazySequence
+from .rope import EventRope
+from .views import EventView
+from .playback import (Scheduler, PlaybackStats, AsyncPlayback,
+VirtualClock)
+from .streaming import (CTStream, stream_loop, stream_transpose,
+stream_retrograde, stream_map_to_pulses, stream_map_to_pitches)
 from .composers.constraints import (constraint_in_set,
 constraint_no_repeated_adjacent_notes, constraint_limit_shared_pitches,
 constraint_enforce_shared_pitches, constraint_no_leaps_more_than,
@@ -16,7 +29,9 @@ from .composers.evolutionary import Extinction, Evolutionary
 from .composers.heuristics import (heuristic_sine_shape,
 heuristic_trend_upwards, heuristic_single_pitch)
 from .composers.solvers import (random_walk, UnsatisfiableException,
-random_walk_backtracking, random_walk_backtracking_w_heuristics)
+random_walk_backtracking, random_walk_backtracking_w_heuristics,
+DeadPathIndex, SolverState, random_walk_bitset)
+from .composers.parallel import solve_first, solve_distinct
 from .resources.chords import (CHROMATIC_SCALE_PITCH_CLASSES,
 COMMON_TRIAD_PITCH_CLASSES, COMMON_TRETRAD_PITCH_CLASSES,
 to_pitch_class_set, set_compliment)
@@ -0,0 +1,94 @@
+"""
+Rendering many Containers to MIDI files in parallel, eg:
+
+    jobs = (("piece_{}.mid".format(i), make_container) for i in range(10000))
+    results = render_midi_files(jobs, progress=print)
+    failures = [r for r in results if r.error is not None]
+"""
+from collections import deque, namedtuple
+import multiprocessing
+import os
+import pickle
+
+from .core import Container, CTSequence
+
+RenderResult = namedtuple("RenderResult", ["filename", "error"])
+RenderResult.__doc__ = """The outcome of rendering one file: error is None on
+success, otherwise a description of the exception raised"""
+
+def render_midi_files(jobs, processes=None, chunksize=16, progress=None,
+        dynamic=60):
+    """Save each (filename, source) pair in jobs as a MIDI file, using a
+    pool of worker processes.
+
+    source is either a Container or a picklable callable taking no
+    arguments that returns one (eg. a module level function, or a
+    functools.partial of one), in which case the container is built in
+    the worker. Jobs are handed to the workers chunksize at a time.
+
+    A job that fails does not stop the batch: its RenderResult records
+    the error instead. If given, progress(result, n_done, n_total) is
+    called in the calling thread as each job completes (n_total is None if
+    jobs has no len). Returns the RenderResults in order of completion.
+    """
+    try:
+        n_total = len(jobs)
+    except TypeError:
+        n_total = None
+    if processes is None:
+        processes = os.cpu_count() or 1
+    results = []
+    # jobs that could not be sent to a worker. payloads() runs in the
+    # pool's task handler thread, so these are queued for this thread
+    # to record, rather than recorded there
+    unsent = deque()
+    def record(result):
+        results.append(result)
+        if progress is not None:
+            progress(result, len(results), n_total)
+    def record_all(rendered):
+        for result in rendered:
+            while unsent:
+                record(unsent.popleft())
+            record(result)
+        while unsent:
+            record(unsent.popleft())
+    def payloads():
+        for filename, source in jobs:
+            try:
+                yield (filename, _pickle_source(source), dynamic)
+            except Exception as e:
+                unsent.append(RenderResult(filename, _describe(e)))
+    if processes == 1:
+        record_all(map(_render, payloads()))
+        return results
+    with multiprocessing.Pool(processes) as pool:
+        record_all(pool.imap_unordered(_render, payloads(), chunksize))
+    return results
+
+def _pickle_source(source):
+    """pickle the source of a job in this process, so that a job that
+    cannot be sent to a worker fails alone. Containers are sent without
+    the history of their sequences.
+    """
+    if isinstance(source, Container):
+        container = Container(**source.options)
+        for (channel_no, offset, seq) in source.sequences:
+            container.add_sequence(offset, CTSequence(seq.events), channel_no)
+        source = container
+    elif not callable(source):
+        raise TypeError("expected a Container or a callable returning one")
+    return pickle.dumps(source, pickle.HIGHEST_PROTOCOL)
+
+def _render(payload):
+    filename, source, dynamic = payload
+    try:
+        source = pickle.loads(source)
+        container = source if isinstance(source, Container) else source()
+        container.save_as_midi_file(filename, dynamic)
+        return RenderResult(filename, None)
+    except Exception as e:
+        return RenderResult(filename, _describe(e))
+
+def _describe(e):
+    return "{}: {}".format(type(e).__name__, e)
@@ -1,22 +1,29 @@
 import itertools
 import math
 
+import numpy as np
+
+from ..columnar import ColumnarEvents
 from ..core import CTEvent, CTSequence, CTTransformer
+from ..lazy import PitchAffine, EventMap
+from ..rope import EventRope
+from ..views import EventView
 
 @CTTransformer
 def loop(seq, n_times=1):
     if n_times < 0:
         raise ValueError("n_times cannot be less than 0")
-    result = []
-    for i in range(n_times):
-        result = result + seq.events
-    return result
+    return EventRope.from_events(seq.events).repeat(n_times)
     
 @CTTransformer
 def transpose(seq, interval):
     """Transpose all pitches in the 
     given sequence by a constant interval.
     """
+    if isinstance(seq.events, ColumnarEvents):
+        events = seq.events
+        return ColumnarEvents(
+            events.pitch_array + interval, events.offsets, events.duration_array)
     result = []
     for evt in seq.events:
         result.append(
@@ -25,14 +32,23 @@ def transpose(seq, interval):
                 evt.duration))
     return result
     
+@transpose.fuse_with
+def _transpose_kernel(first, interval):
+    return PitchAffine(1, interval)
+    
 @CTTransformer
 def retrograde(seq):
-    events = seq.events[:]
-    events.reverse()
-    return events
+    """The events in reverse order, as a read-only view (see
+    composerstoolkit.views) unless they are columnar
+    """
+    if isinstance(seq.events, ColumnarEvents):
+        return seq.events[::-1]
+    return EventView.of(seq.events).reversed()
     
 @CTTransformer
 def invert(seq, axis_pitch=None):
+    if isinstance(seq.events, ColumnarEvents):
+        return _invert_columnar(seq.events, axis_pitch)
     if axis_pitch is None:
         axis_pitch = seq.events[0].pitches[0]
     res = []
@@ -46,22 +62,44 @@ def invert(seq, axis_pitch=None):
             res.append(CTEvent(evt.pitches[0], evt.duration))
     return res
     
+@invert.fuse_with
+def _invert_kernel(first, axis_pitch=None):
+    if axis_pitch is None:
+        axis_pitch = first().pitches[0]
+    return PitchAffine(-1, 2 * axis_pitch, top_only=True)
+    
+def _invert_columnar(events, axis_pitch):
+    top = events.top_pitches()
+    if axis_pitch is None:
+        axis_pitch = top[0]
+    return ColumnarEvents(
+        axis_pitch - (top - axis_pitch),
+        np.arange(len(events) + 1),
+        events.duration_array)
+    
 @CTTransformer
 def rotate(seq, no_times=1):
-    if seq.events == []:
+    """The events moved no_times to the left, as a read-only view (see
+    composerstoolkit.views) unless they are columnar
+    """
+    n = len(seq.events)
+    if n == 0:
         return []
-    rotated = seq.events[:]
-    for i in range(no_times):
-        rotated = rotated[1:] + [rotated[0]]
-    return rotated
+    # each rotation moves one event from the front to the back
+    k = no_times % n if no_times > 0 else 0
+    if isinstance(seq.events, ColumnarEvents):
+        return seq.events.take((np.arange(n) + k) % n)
+    return EventView.of(seq.events).rotated(k)
     
-@CTTransformer
+@CTTransformer.impure
 def mutation(seq, threshold=0.5, transformations=[], constraints=[]):
     raise NotImplementedError
 
 @CTTransformer
 def aggregate_into_chords(seq, n_voices=4, duration=1):
     # break a linear sequence into a series of evenly-spaced chords
+    if isinstance(seq.events, ColumnarEvents):
+        return _aggregate_into_chords_columnar(seq.events, n_voices, duration)
     events = seq.events[:]
     result = []
     for i in range(0, len(events), n_voices):
@@ -70,6 +108,18 @@ def aggregate_into_chords(seq, n_voices=4, duration=1):
         result.append(CTEvent(pitches, duration))
     return result
     
+def _aggregate_into_chords_columnar(events, n_voices, duration):
+    # every n_voices-th offset marks the start of a chord, the pitch
+    # array itself is unchanged
+    n = len(events)
+    offsets = events.offsets[0:n+1:n_voices]
+    if n % n_voices:
+        offsets = np.append(offsets, events.offsets[n])
+    return ColumnarEvents(
+        events.pitch_array,
+        offsets,
+        np.full(len(offsets) - 1, duration))
+    
 # @CTTransformer
 # def linear_interpolate(seq, resolution=1):
     # events = seq.events[:]
@@ -110,6 +160,8 @@ def aggregate_into_chords(seq, n_voices=4, duration=1):
     
 @CTTransformer
 def explode_intervals(seq, factor, mode="exponential"):
+    if isinstance(seq.events, ColumnarEvents):
+        return _explode_intervals_columnar(seq.events, factor, mode)
     events = seq.events[:]
     if len(events) is 1:
         return events
@@ -146,14 +198,62 @@ def explode_intervals(seq, factor, mode="exponential"):
             break
     return result
     
+def _explode_intervals_columnar(events, factor, mode):
+    if len(events) == 1:
+        return events
+    if len(events) == 0:
+        raise IndexError("cannot explode an empty sequence")
+    top = events.top_pitches()
+    if mode == "exponential":
+        interval_vectors = factor * np.diff(top)
+    elif mode == "linear":
+        interval_vectors = factor + np.diff(top)
+    else:
+        raise Exception("unrecognised mode "+ mode)
+    
+    if np.all(np.mod(interval_vectors, 1) == 0):
+        # every step lands on a whole pitch, so the running math.ceil
+        # is a no-op and the walk collapses into a cumulative sum
+        exploded = (top[0] + np.cumsum(interval_vectors)).astype(np.int64)
+    else:
+        exploded = []
+        pitch = top[0].item()
+        for vector in interval_vectors.tolist():
+            pitch = math.ceil(vector + pitch)
+            exploded.append(pitch)
+    # first item in the seq stays as-is
+    first = events.pitch_array[events.offsets[0]:events.offsets[1]]
+    return ColumnarEvents(
+        np.concatenate([first, np.asarray(exploded, dtype=np.int64)]),
+        np.concatenate([[0], np.arange(len(first), len(first) + len(events))]),
+        events.duration_array)
+    
 @CTTransformer
 def rhythmic_augmentation(seq, multiplier):
+    if isinstance(seq.events, ColumnarEvents):
+        events = seq.events
+        return ColumnarEvents(
+            events.pitch_array, events.offsets, multiplier * events.duration_array)
     return [CTEvent(e.pitches, multiplier*e.duration) for e in seq.events]
     
+@rhythmic_augmentation.fuse_with
+def _rhythmic_augmentation_kernel(first, multiplier):
+    return EventMap(lambda i, e: CTEvent(e.pitches, multiplier*e.duration))
+    
 @CTTransformer
 def rhythmic_diminution(seq, factor):
+    if isinstance(seq.events, ColumnarEvents):
+        if factor == 0:
+            raise ZeroDivisionError("division by zero")
+        events = seq.events
+        return ColumnarEvents(
+            events.pitch_array, events.offsets, events.duration_array / factor)
     return [CTEvent(e.pitches, e.duration/factor) for e in seq.events]
     
+@rhythmic_diminution.fuse_with
+def _rhythmic_diminution_kernel(first, factor):
+    return EventMap(lambda i, e: CTEvent(e.pitches, e.duration/factor))
+    
 @CTTransformer
 def map_to_pulses(seq, pulse_sequence):
     iter_pulses = iter(pulse_sequence.events)
@@ -167,8 +267,19 @@ def map_to_pulses(seq, pulse_sequence):
             #result.append(CTEvent(e.pitches, 0))
     return result
     
+@map_to_pulses.fuse_with
+def _map_to_pulses_kernel(first, pulse_sequence):
+    pulses = pulse_sequence.events
+    def f(i, e):
+        if i >= len(pulses):
+            return None
+        return CTEvent(e.pitches, pulses[i].duration)
+    return EventMap(f)
+    
 @CTTransformer
 def map_to_pitches(seq, pitch_sequence):
+    if isinstance(seq.events, ColumnarEvents):
+        return _map_to_pitches_columnar(seq.events, pitch_sequence.events)
     iter_pitches = iter(pitch_sequence.events)
     result = []
     for e in seq.events:
@@ -178,3 +289,25 @@ def map_to_pitches(seq, pitch_sequence):
         except StopIteration:
             result.append(CTEvent(None, e.duration))
     return result
+    
+@map_to_pitches.fuse_with
+def _map_to_pitches_kernel(first, pitch_sequence):
+    pitches = pitch_sequence.events
+    def f(i, e):
+        if i >= len(pitches):
+            return CTEvent(None, e.duration)
+        return CTEvent(pitches[i].pitches[0], e.duration)
+    return EventMap(f)
+    
+def _map_to_pitches_columnar(events, pitch_events):
+    n = len(events)
+    n_mapped = min(n, len(pitch_events))
+    if isinstance(pitch_events, ColumnarEvents):
+        pitches = pitch_events[:n_mapped].top_pitches()
+    else:
+        pitches = [e.pitches[0] for e in itertools.islice(pitch_events, n_mapped)]
+    # events beyond the end of pitch_sequence are left empty
+    offsets = np.concatenate([
+        np.arange(n_mapped + 1),
+        np.full(n - n_mapped, n_mapped)])
+    return ColumnarEvents(pitches, offsets, events.duration_array)
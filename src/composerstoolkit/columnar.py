@@ -0,0 +1,149 @@
+import itertools
+
+import numpy as np
+
+from .core import CTEvent, EventStore
+
+class ColumnarEvents(EventStore):
+    """Array-backed storage for a sequence of CTEvents.
+
+    Rather than one CTEvent (and one list of pitches) per event, the
+    sequence is held as three flat arrays:
+
+    - pitch_array: every pitch of every event, in order
+    - offsets: len(events) + 1 indices into pitch_array, such that the
+        pitches of event i are pitch_array[offsets[i]:offsets[i+1]]
+    - duration_array: the duration of each event
+
+    CTEvents are only built on access, so a ColumnarEvents instance can
+    be used anywhere CTSequence.events is read (iteration, indexing,
+    slicing, comparison with a list of events). It is read-only.
+    """
+    
+    shares_slices = True
+
+    def __init__(self, pitch_array, offsets, duration_array):
+        self.pitch_array = _as_pitch_array(pitch_array)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.duration_array = np.asarray(duration_array)
+        if len(self.offsets) != len(self.duration_array) + 1:
+            raise ValueError("offsets must have one more entry than durations")
+
+    @classmethod
+    def from_events(cls, events):
+        if isinstance(events, ColumnarEvents):
+            return events
+        events = list(events)
+        counts = [len(e.pitches) for e in events]
+        offsets = np.zeros(len(events) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        pitches = list(itertools.chain.from_iterable([e.pitches for e in events]))
+        return cls(pitches, offsets, [e.duration for e in events])
+
+    @property
+    def nbytes(self):
+        return (self.pitch_array.nbytes + self.offsets.nbytes
+            + self.duration_array.nbytes)
+
+    @property
+    def counts(self):
+        """number of pitches held by each event"""
+        return np.diff(self.offsets)
+
+    @property
+    def pitches(self):
+        return self.pitch_array[self.offsets[0]:self.offsets[-1]].tolist()
+
+    @property
+    def durations(self):
+        return self.duration_array.tolist()
+
+    def top_pitches(self):
+        """the first (uppermost) pitch of every event, as an array"""
+        if np.any(self.counts == 0):
+            # mirrors the IndexError raised by evt.pitches[0]
+            raise IndexError("event has no pitches")
+        return self.pitch_array[self.offsets[:-1]]
+
+    def to_pitch_set(self):
+        return set(np.unique(
+            self.pitch_array[self.offsets[0]:self.offsets[-1]]).tolist())
+
+    def take(self, indices):
+        """return a new ColumnarEvents holding the events at the given
+        (integer array of) indices
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self.offsets[indices]
+        counts = self.offsets[indices + 1] - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        # position of every wanted pitch within pitch_array
+        positions = (np.arange(offsets[-1], dtype=np.int64)
+            + np.repeat(starts - offsets[:-1], counts))
+        return ColumnarEvents(
+            self.pitch_array[positions],
+            offsets,
+            self.duration_array[indices])
+
+    def __len__(self):
+        return len(self.duration_array)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return self.take(np.arange(start, stop, step))
+            stop = max(start, stop)
+            offsets = self.offsets[start:stop + 1]
+            # contiguous slices share the underlying buffers
+            return ColumnarEvents(
+                self.pitch_array[offsets[0]:offsets[-1]],
+                offsets - offsets[0],
+                self.duration_array[start:stop])
+        n = len(self)
+        if index < 0:
+            index = index + n
+        if index < 0 or index >= n:
+            raise IndexError("event index out of range")
+        return CTEvent(
+            self.pitch_array[self.offsets[index]:self.offsets[index+1]].tolist(),
+            self.duration_array[index].item())
+
+    def __iter__(self):
+        pitches = self.pitch_array.tolist()
+        offsets = self.offsets.tolist()
+        durations = self.duration_array.tolist()
+        for i in range(len(durations)):
+            yield CTEvent(pitches[offsets[i]:offsets[i+1]], durations[i])
+
+    def __eq__(self, other):
+        if isinstance(other, ColumnarEvents):
+            return (len(self) == len(other)
+                and np.array_equal(self.duration_array, other.duration_array)
+                and np.array_equal(self.counts, other.counts)
+                and np.array_equal(
+                    self.pitch_array[self.offsets[0]:self.offsets[-1]],
+                    other.pitch_array[other.offsets[0]:other.offsets[-1]]))
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __add__(self, other):
+        if not isinstance(other, ColumnarEvents):
+            return super().__add__(other)
+        return ColumnarEvents(
+            np.concatenate([
+                self.pitch_array[self.offsets[0]:self.offsets[-1]],
+                other.pitch_array[other.offsets[0]:other.offsets[-1]]]),
+            np.concatenate([
+                self.offsets - self.offsets[0],
+                (other.offsets[1:] - other.offsets[0]) + (self.offsets[-1] - self.offsets[0])]),
+            np.concatenate([self.duration_array, other.duration_array]))
+
+def _as_pitch_array(pitches):
+    pitches = np.asarray(pitches)
+    if pitches.size == 0:
+        # an empty list would otherwise default to float64
+        return pitches.astype(np.int64)
+    return pitches
@@ -1,50 +1,177 @@
+"""
+Constraints used to steer the solvers (see composers.solvers).
+
+A constraint is a callable f(context) -> bool, where context is a tuple
+of (note, seq, tick).
+
+A constraint may also declare a domain: a function attached as
+f.domain(tick, prefix), returning the pitches that f would accept for
+the note following prefix (the list of pitches chosen so far) at the
+given tick, as a set or range, or None if it places no limit on them.
+The backtracking solvers intersect the domains of their constraints
+before choosing a note, rather than drawing notes and rejecting them
+one at a time, and only call the constraints that do not declare one.
+A domain must therefore hold exactly the notes that f would accept.
+
+Rather than a domain, a constraint may declare f.incremental(note, state),
+deciding on note from the running state of the search (a
+composers.solvers.SolverState: the tick, the pitches so far, the last
+pitch, the running pitch counts and any aligned voices), so that it
+need not look over the whole sequence for each note. The solvers call
+every constraint through incremental(), which adapts the others.
+
+For the backjumping solvers, a constraint may declare f.lookback: how
+many of the preceding notes it reads (0 if it depends on the note
+alone), or a function of the tick returning the ticks of the notes it
+reads. A constraint without one is taken to read every preceding note.
+
+For random_walk_bitset, which holds domains as bitmasks (bit p set for
+pitch p, see pitch_mask), a constraint may also declare f.mask(tick,
+prefix), returning its domain as a mask, or None. Otherwise its domain
+is converted: ranges arithmetically, frozensets once each.
+"""
+from ..builder.generators import cantus
+from ..resources import NOTE_MIN, NOTE_MAX
+
+_ALL_PITCHES = range(NOTE_MIN, NOTE_MAX + 1)
+
 def constraint_in_set(_set = range(0,128)):
+    allowed = _set if isinstance(_set, range) else frozenset(_set)
     def f(context):
         note, seq, tick = context
         if seq.to_pitch_set() == {}:
             return False
         return seq.to_pitch_set().issubset(_set)
+    def domain(tick, prefix):
+        # the pitches chosen so far have been vetted, save the first
+        if tick <= 0 and not all(pitch in allowed for pitch in prefix):
+            return set()
+        return allowed
+    f.domain = domain
+    f.lookback = 0
     return f
-    
+
 def constraint_no_repeated_adjacent_notes():
     def f(context):
         note, seq, tick = context
-        return seq[0].pitches[0] != context["previous"][-1].pitches[0]
+        pitches = seq.pitches
+        return len(pitches) < 2 or pitches[-1] != pitches[-2]
+    def domain(tick, prefix):
+        if not prefix:
+            return None
+        return _all_but(prefix[-1])
+    def mask(tick, prefix):
+        if not prefix:
+            return None
+        return _ALL_PITCHES_MASK & ~pitch_mask([prefix[-1]])
+    f.domain = domain
+    f.mask = mask
+    f.lookback = 1
     return f
-    
+
+# the pitches other than p, for each p so far asked for. Being the same
+# frozenset each time, its mask (see _compile_mask) is only built once.
+_ALL_BUT = {}
+
+def _all_but(pitch):
+    try:
+        return _ALL_BUT[pitch]
+    except KeyError:
+        _ALL_BUT[pitch] = frozenset(_ALL_PITCHES) - {pitch}
+        return _ALL_BUT[pitch]
+
 def constraint_limit_shared_pitches(max_shared=1):
     def f(context):
         note, seq, tick = context
         intersection = set(seq.pitches).intersection(set(context["previous"].pitches))
         return len(intersection) <= max_shared
     return f
-    
+
 def constraint_enforce_shared_pitches(min_shared=1):
     def f(context):
         note, seq, tick = context
         intersection = set(seq.pitches).intersection(set(context["previous"].pitches))
         return len(intersection) >= min_shared
     return f
-    
+
 def constraint_no_leaps_more_than(max_int):
     def f(context):
         note, seq, tick = context
         previous_pitch = seq.events[-2].pitches[0]
         delta =  note - previous_pitch
         return abs(delta) <= max_int
+    def domain(tick, prefix):
+        previous_pitch = prefix[-1]
+        return range(previous_pitch - max_int, previous_pitch + max_int + 1)
+    f.domain = domain
+    f.lookback = 1
     return f
-    
+
 def constraint_note_is(tick=0,pitch=0):
     def f(context):
         event, seq, _tick = context
         if _tick != tick:
             return True
-        return event.pitches[0] == pitch
+        return _pitch_of(event) == pitch
+    def domain(_tick, prefix):
+        if _tick != tick:
+            return None
+        return {pitch}
+    f.domain = domain
+    f.lookback = 0
     return f
-    
+
 def constraint_voice2_is_lower_than(voice1):
     def f(context):
         event, seq, tick = context
         #print(tick, voice1[tick], note, voice1[tick] >= note)
-        return voice1[tick].pitches[0] >= event.pitches[0]
-    return f
\ No newline at end of file
+        return voice1[tick].pitches[0] >= _pitch_of(event)
+    def domain(tick, prefix):
+        return range(NOTE_MIN, voice1.events[tick].pitches[0] + 1)
+    f.domain = domain
+    f.lookback = 0
+    return f
+
+def pitch_mask(pitches):
+    """the bitmask of pitches (an iterable, or a range, which is converted
+    without iterating over it), with bit p set for each pitch p
+    """
+    if isinstance(pitches, range) and pitches.step == 1:
+        start = max(pitches.start, NOTE_MIN)
+        stop = min(pitches.stop, NOTE_MAX + 1)
+        if stop <= start:
+            return 0
+        return ((1 << (stop - start)) - 1) << start
+    mask = 0
+    for pitch in pitches:
+        if NOTE_MIN <= pitch <= NOTE_MAX:
+            mask = mask | (1 << pitch)
+    return mask
+
+_ALL_PITCHES_MASK = pitch_mask(_ALL_PITCHES)
+
+def incremental(constraint):
+    """constraint as a function of (note, state), as described above. A
+    plain f(context) is called with a sequence built from the pitches so
+    far, as it would be otherwise.
+    """
+    try:
+        return constraint.incremental
+    except AttributeError:
+        pass
+    if hasattr(constraint, "domain"):
+        def f(note, state):
+            allowed = constraint.domain(state.tick, state.pitches)
+            return allowed is None or note in allowed
+        return f
+    def f(note, state):
+        context = (note, cantus(state.pitches + [note]), state.tick)
+        return constraint(context) == True
+    return f
+
+def _pitch_of(note):
+    # the solvers pass bare pitches, rather than events
+    try:
+        return note.pitches[0]
+    except AttributeError:
+        return note
@@ -1,43 +1,70 @@
 import math
 import random
 
+import numpy as np
+
+from ..resources import NOTE_MIN, NOTE_MAX
+
 """
 Heuristic functions used to guide random generation
 (see composers.solver.random_walk_backtracking_w_heuristics)
+
+A heuristic is a function f(tick, choices, weights) -> weights, adjusting
+the weight given to each of the choices of note. It may also declare
+an array version, f.array(tick, weights) -> weights, where weights is a
+numpy array of the weight of every pitch from NOTE_MIN to NOTE_MAX (which
+it should not change in place), used by the solver in preference. The
+heuristics below add a row of weights to the array, tabulated once for
+each tick and kept for reuse.
 """
 
+PITCHES = np.arange(NOTE_MIN, NOTE_MAX + 1)
+
 def heuristic_sine_shape(axis_pitch=60,amplitude=30,length=16, strength=1):
     # this will try and make the music obey the shape of a single sine wave cycle
-    def f(tick, choices, weights):
+    def row(tick):
         angle = (tick+1)/length * 360
         value = math.sin(math.radians(angle))
         target_note = math.ceil(axis_pitch + (value * amplitude))
-        for i in range(len(choices)):
-            if i < axis_pitch-amplitude or i > axis_pitch+amplitude:
-                continue
-            note = choices[i]
-            compensating_value = 1 - (abs(note-target_note)/amplitude)
-            if compensating_value > 0:
-                weights[i] = weights[i] + math.pow(compensating_value, strength) * 100
-        return weights
-    return f
-    
+        compensating_values = 1 - (np.abs(PITCHES - target_note) / amplitude)
+        in_window = ((PITCHES >= axis_pitch-amplitude)
+            & (PITCHES <= axis_pitch+amplitude) & (compensating_values > 0))
+        return np.where(in_window,
+            np.power(np.where(in_window, compensating_values, 0), strength) * 100, 0.0)
+    return _additive(_per_tick(row))
+
 def heuristic_trend_upwards(axis=60, strength=1):
-    def f(tick, choices, weights):
-        for i in range(len(choices)):
-            note = choices[i]
-            if note > axis:
-                weights[i] = weights[i] + strength
-        return weights
-    return f
-    
+    increments = np.where(PITCHES > axis, float(strength), 0.0)
+    return _additive(lambda tick: increments)
+
 def heuristic_single_pitch(axis_pitch=60, slope=30, strength=1):
     # this will try and make the music obey the shape of a single axis pitch
+    compensating_values = 1 - (np.abs(PITCHES - axis_pitch) / slope)
+    increments = np.where(compensating_values > 0,
+        np.power(np.maximum(compensating_values, 0), strength) * 100, 0.0)
+    return _additive(lambda tick: increments)
+
+def _per_tick(row):
+    """row(tick), computed once for each tick"""
+    rows = {}
+    def f(tick):
+        try:
+            return rows[tick]
+        except KeyError:
+            rows[tick] = row(tick)
+            return rows[tick]
+    return f
+
+def _additive(increments):
+    """the heuristic adding increments(tick), an array over PITCHES, to
+    the weights
+    """
     def f(tick, choices, weights):
+        row = increments(tick)
         for i in range(len(choices)):
-            note = choices[i]
-            compensating_value = 1 - (abs(note-axis_pitch)/slope)
-            if compensating_value > 0:
-                weights[i] = weights[i] + math.pow(compensating_value, strength) * 100
+            weights[i] = weights[i] + float(row[choices[i] - NOTE_MIN])
         return weights
-    return f
\ No newline at end of file
+    def array(tick, weights):
+        return weights + increments(tick)
+    f.array = array
+    return f
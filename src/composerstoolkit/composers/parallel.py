@@ -0,0 +1,104 @@
+"""
+Running many independently seeded searches at once, eg:
+
+    seq = solve_first(random_walk_backtracking, max_starts=32,
+        starting_pitch=60, n_events=64, constraints=constraints)
+    seqs = solve_distinct(random_walk_backtracking, 10,
+        starting_pitch=60, n_events=64, constraints=constraints)
+
+A randomised backtracking search can take far longer on some seeds than
+on others, or fail outright, so running several and keeping the first
+to finish is usually much quicker than waiting on one.
+
+The searches run in a pool of worker processes, forked from this one so
+that the solver and its arguments (constraints are usually closures)
+need not be pickled. Where fork is unavailable, or processes is 1, the
+searches run one after another in this process.
+"""
+import multiprocessing
+import os
+import random
+
+from .solvers import UnsatisfiableException
+
+def solve_first(solver, max_starts=64, processes=None, seed=None, **kwargs):
+    """Run up to max_starts searches solver(rng=random.Random(s), **kwargs),
+    each with its own seed s, and return the result of the first to
+    succeed, stopping the rest.
+
+    seed - seeds the choice of seed for each search, if given
+
+    raises UnsatisfiableException if every search fails
+    """
+    solutions = _solutions(solver, max_starts, processes, seed, kwargs)
+    try:
+        for solution in solutions:
+            return solution
+    finally:
+        solutions.close()
+    raise UnsatisfiableException(
+        "No solution found in {} starts".format(max_starts))
+
+def solve_distinct(solver, n_solutions, max_starts=None, processes=None,
+        seed=None, **kwargs):
+    """As solve_first, but collect n_solutions distinct results, from up
+    to max_starts searches (by default 4 * n_solutions), and return them
+    as a list in the order they were found
+
+    raises UnsatisfiableException if fewer than n_solutions are found
+    """
+    if max_starts is None:
+        max_starts = 4 * n_solutions
+    found = _solutions(solver, max_starts, processes, seed, kwargs)
+    solutions = []
+    seen = set()
+    try:
+        for solution in found:
+            if solution in seen:
+                continue
+            seen.add(solution)
+            solutions.append(solution)
+            if len(solutions) == n_solutions:
+                return solutions
+    finally:
+        found.close()
+    raise UnsatisfiableException(
+        "Found {} of {} solutions in {} starts".format(
+            len(solutions), n_solutions, max_starts))
+
+def _solutions(solver, max_starts, processes, seed, kwargs):
+    """yield the result of each search that succeeds, in the order they
+    finish. The pool is torn down (stopping any searches still running)
+    as soon as the caller stops asking for more.
+    """
+    seeds = random.Random(seed)
+    starts = (seeds.getrandbits(64) for i in range(max_starts))
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        _init(solver, kwargs)
+        for result in map(_search, starts):
+            if result is not None:
+                yield result
+        return
+    context = multiprocessing.get_context("fork")
+    with context.Pool(processes, _init, (solver, kwargs)) as pool:
+        for result in pool.imap_unordered(_search, starts):
+            if result is not None:
+                yield result
+
+# the search run by each worker, set up by the pool initializer (and
+# inherited, rather than pickled, when the worker is forked)
+_solver = None
+_kwargs = None
+
+def _init(solver, kwargs):
+    global _solver, _kwargs
+    _solver = solver
+    _kwargs = kwargs
+
+def _search(seed):
+    try:
+        return _solver(rng=random.Random(seed), **_kwargs)
+    except UnsatisfiableException:
+        return None
@@ -1,10 +1,15 @@
+import collections
 import itertools
 import math
 import random
+import sys
+
+import numpy as np
 
 from composerstoolkit.core import (CTEvent, CTSequence)
 from composerstoolkit.builder.generators import cantus
 from composerstoolkit.resources import NOTE_MIN, NOTE_MAX
+from composerstoolkit.composers.constraints import incremental, pitch_mask
 
 def random_walk(base_seq, mutators=[lambda x: x], 
     constraints=[lambda x: True], adjust_weights=True):
@@ -60,8 +65,154 @@ def random_walk(base_seq, mutators=[lambda x: x],
     
 class UnsatisfiableException(Exception): pass
     
+class DeadPathIndex():
+    """The paths (lists of pitches) found to lead nowhere during a
+    backtracking search, held as a trie of pitches.
+    
+    The index keeps a cursor on the trie node of the path currently
+    being explored, which the solver moves with push() and pop() as it
+    extends and backtracks, so that is_dead(note) tests whether
+    path + [note] is dead in constant time, however many dead paths
+    there are or however long they grow.
+    
+    If max_entries is given, the oldest dead paths are forgotten once
+    more than that number are held.
+    """
+    
+    def __init__(self, max_entries=None):
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.evicted = 0
+        self._root = _TrieNode(None, None)
+        self._entries = collections.deque()
+        self._path = []
+        # the trie node for each prefix of _path, or None once the path
+        # leaves the trie (in which case nothing beyond it is dead)
+        self._cursor = [self._root]
+        
+    def __len__(self):
+        return len(self._entries)
+        
+    def push(self, note):
+        """move the cursor on by note"""
+        self._path.append(note)
+        node = self._cursor[-1]
+        self._cursor.append(None if node is None else node.children.get(note))
+        
+    def pop(self):
+        """move the cursor back by one note"""
+        self._path.pop()
+        self._cursor.pop()
+        
+    def is_dead(self, note):
+        """whether the current path followed by note is dead"""
+        node = self._cursor[-1]
+        if node is None:
+            return False
+        child = node.children.get(note)
+        return child is not None and child.dead
+        
+    def add_current(self):
+        """record the current path as dead"""
+        node = self._root
+        for i, note in enumerate(self._path):
+            child = node.children.get(note)
+            if child is None:
+                child = node.children[note] = _TrieNode(node, note)
+            node = child
+            self._cursor[i+1] = node
+        if node.dead:
+            return
+        node.dead = True
+        self._entries.append(node)
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._evict(self._entries.popleft())
+            
+    def _evict(self, node):
+        node.dead = False
+        self.evicted = self.evicted + 1
+        # prune the branch that no longer leads to a dead path
+        while node.parent is not None and not node.dead and not node.children:
+            del node.parent.children[node.note]
+            node = node.parent
+        # the cursor may have pointed into the pruned branch
+        node = self._root
+        for i, note in enumerate(self._path):
+            node = None if node is None else node.children.get(note)
+            self._cursor[i+1] = node
+            
+    @property
+    def nbytes(self):
+        """approximate memory held by the trie, in bytes"""
+        total = 0
+        nodes = [self._root]
+        while nodes:
+            node = nodes.pop()
+            total = total + sys.getsizeof(node) + sys.getsizeof(node.children)
+            nodes.extend(node.children.values())
+        return total
+        
+class _TrieNode():
+    __slots__ = ["parent", "note", "children", "dead"]
+    
+    def __init__(self, parent, note):
+        self.parent = parent
+        self.note = note
+        self.children = {}
+        self.dead = False
+        
+class SolverState():
+    """The running state of a backtracking search, kept up to date by
+    the solver as it extends and backtracks, for incremental constraints
+    (see composers.constraints):
+    
+    tick - the tick of the next note
+    pitches - the pitches chosen so far
+    pitch_counts - how many times each of them occurs
+    voices - the pitches of any voices aligned with the one being solved
+    """
+    
+    def __init__(self, starting_pitch, voices=()):
+        self.tick = 0
+        self.pitches = [starting_pitch]
+        self.pitch_counts = collections.Counter(self.pitches)
+        self.voices = [_pitches_of(voice) for voice in voices]
+        
+    @property
+    def last_pitch(self):
+        return self.pitches[-1]
+        
+    @property
+    def pitch_set(self):
+        return self.pitch_counts.keys()
+        
+    def aligned(self):
+        """the pitch of each voice at this tick"""
+        return [voice[self.tick] for voice in self.voices]
+        
+    def push(self, note):
+        self.pitches.append(note)
+        self.pitch_counts[note] = self.pitch_counts[note] + 1
+        self.tick = self.tick + 1
+        
+    def pop(self):
+        note = self.pitches.pop()
+        self.pitch_counts[note] = self.pitch_counts[note] - 1
+        if self.pitch_counts[note] == 0:
+            del self.pitch_counts[note]
+        self.tick = self.tick - 1
+        return note
+        
+def _pitches_of(voice):
+    try:
+        return [event.pitches[0] for event in voice.events]
+    except AttributeError:
+        return list(voice)
+        
 def random_walk_backtracking(starting_pitch=60, 
-        n_events=64, constraints=[lambda x: True]):
+        n_events=64, constraints=[lambda x: True], max_dead_paths=None,
+        stats=None, voices=(), rng=None, backjumping=False):
     """Extend a given pitch sequence  by up to n_events, using
     an unweighted random selection process and backtracking solver.
     
@@ -72,89 +223,326 @@ def random_walk_backtracking(starting_pitch=60,
         will backtrack to select a new path. 'Dead' paths are tracked and rejected.
         Each constraint recieves a tuple of (note, seq, tick), where tick is the number
         of the event.
+    max_dead_paths - if given, only this many of the most recent dead paths are
+        remembered (see DeadPathIndex)
+    stats - if given a dict, it is updated with the number of notes tried
+        ("nodes"), the number of times the search backed up ("backtracks"),
+        the furthest tick reached ("max_depth") and either the number of dead
+        paths recorded ("dead_paths"), the number forgotten ("dead_paths_evicted")
+        and the approximate memory used to hold them ("dead_paths_nbytes"), or,
+        if backjumping, the number of nogoods learned ("nogoods")
+    voices - sequences (or lists of pitches) aligned with the one being solved,
+        for incremental constraints (see SolverState)
+    rng - the random.Random instance to draw from, if not the random module
+    backjumping - if True, on reaching a dead-end the solver jumps straight back
+        to the latest tick that caused it, rather than the one before, and
+        records the conflict as a nogood (see _backjump_search)
     
     returns: CTSequence or UnsatisfiableException if a solution that satisfies the
         constraints cannot be found.
         
     """
-    tick = 0
-    seq = [starting_pitch]
+    rng = rng or random
+    def choose(tick, choices):
+        return rng.choice(choices)
+    return _search(starting_pitch, n_events, constraints, choose,
+        max_dead_paths, stats, voices, backjumping)
+    
+def random_walk_backtracking_w_heuristics(starting_pitch=60,
+        n_events=8, constraints=[lambda x: True], 
+        heuristics=[lambda context,choices,weights: weights],
+        max_dead_paths=None, stats=None, voices=(), rng=None,
+        backjumping=False):
+    """As random_walk_backtracking, but each note is chosen by a weighted
+    random choice, the weights being adjusted by each of heuristics in
+    turn: f(tick, choices, weights) -> weights (or by f.array, if given:
+    see composers.heuristics)
+    """
+    rng = rng or random
+    initial_weights = np.ones(NOTE_MAX - NOTE_MIN + 1)
+    def choose(tick, choices):
+        if not choices:
+            raise IndexError("no choices left")
+        indices = np.array(choices) - NOTE_MIN
+        weights = initial_weights
+        for heuristic in heuristics:
+            if hasattr(heuristic, "array"):
+                weights = heuristic.array(tick, weights)
+            else:
+                weights = weights.copy()
+                weights[indices] = heuristic(tick, choices, list(weights[indices]))
+        # as random.choices, but with the cumulative weights from numpy
+        cumulative = np.cumsum(weights[indices])
+        total = cumulative[-1]
+        if not total > 0:
+            raise ValueError("Total of weights must be greater than zero")
+        i = np.searchsorted(cumulative, rng.random() * total, side="right")
+        return choices[min(int(i), len(choices) - 1)]
+    return _search(starting_pitch, n_events, constraints, choose,
+        max_dead_paths, stats, voices, backjumping)
+    
+def random_walk_bitset(starting_pitch=60, n_events=64,
+        constraints=[lambda x: True], stats=None, voices=(), rng=None):
+    """As random_walk_backtracking, but the notes left to try at each tick
+    are held as a bitmask (bit p set for pitch p), and the domains of the
+    constraints are intersected as masks (see composers.constraints).
+    Each note is forward checked: it is rejected at once if it would
+    leave the next tick with no notes to choose from.
+    
+    stats - if given a dict, it is updated with the number of notes tried
+        ("nodes"), the number of times the search backed up ("backtracks"),
+        the furthest tick reached ("max_depth") and the number of notes
+        rejected by forward checking ("forward_pruned")
+    """
+    rng = rng or random
+    state = SolverState(starting_pitch, voices)
     if n_events == 1:
-        return cantus(seq)
-    choices = list(range(NOTE_MIN, NOTE_MAX))
-    dead_paths = []
-    while tick < n_events-1:
-        # lets use a very basic random choice to begin with and see how far we go
-        try:
-            note = random.choice(choices)
-        except IndexError:
-            # this was thrown because we ran out of choices (we have reached a dead-end)
-            # so you back-track... do it again....
-            dead_paths.append(seq[:])
-            seq = seq[:-1]
-            tick = tick -1
-            choices = list(range(NOTE_MIN, NOTE_MAX))
-            if tick == 0:
-                raise UnsatisfiableException("Unable to solve!")
+        return cantus(state.pitches)
+    masks = [_compile_mask(c) for c in constraints
+        if hasattr(c, "mask") or hasattr(c, "domain")]
+    checks = [incremental(c) for c in constraints
+        if not (hasattr(c, "mask") or hasattr(c, "domain"))]
+    def domain():
+        mask = _CHOICES_MASK
+        for f in masks:
+            allowed = f(state.tick, state.pitches)
+            if allowed is not None:
+                mask = mask & allowed
+        return mask
+    # the notes left to try at each tick so far
+    stack = [domain()]
+    nodes = backtracks = max_depth = forward_pruned = 0
+    try:
+        while state.tick < n_events-1:
+            mask = stack[-1]
+            if not mask:
+                stack.pop()
+                backtracks = backtracks + 1
+                if not stack:
+                    raise UnsatisfiableException("Unable to solve!")
+                note = state.pop()
+                stack[-1] = stack[-1] & ~(1 << note)
+                continue
+            note = _random_bit(mask, rng)
+            nodes = nodes + 1
+            if checks and not all([check(note, state) for check in checks]):
+                stack[-1] = mask & ~(1 << note)
+                continue
+            state.push(note)
+            if state.tick == n_events-1:
                 break
-            else:
+            next_mask = domain()
+            if not next_mask:
+                state.pop()
+                forward_pruned = forward_pruned + 1
+                stack[-1] = mask & ~(1 << note)
                 continue
-        context = (note, cantus(seq + [note]), tick)
-        results = set()
-        for constraint in constraints:
-            results.update([constraint(context)])
-        candidate = seq[:]
-        candidate.append(note)
-        if results == {True} and candidate not in dead_paths:
-            seq.append(note)
-            tick = tick + 1
-            choices = list(range(NOTE_MIN, NOTE_MAX))
-        else:
-            #this choice was bad, so we must exclude it
-            choices.remove(note)
-    return cantus(seq)
+            stack.append(next_mask)
+            max_depth = max(max_depth, state.tick)
+    finally:
+        if stats is not None:
+            stats["nodes"] = nodes
+            stats["backtracks"] = backtracks
+            stats["max_depth"] = max(max_depth, state.tick)
+            stats["forward_pruned"] = forward_pruned
+    return cantus(state.pitches)
     
+_CHOICES_MASK = pitch_mask(range(NOTE_MIN, NOTE_MAX))
+
+def _compile_mask(constraint):
+    """the mask(tick, prefix) function of a constraint, converting its
+    domain if it does not declare one. The masks of frozensets (eg. a
+    scale) are kept, so each is only converted once.
+    """
+    try:
+        return constraint.mask
+    except AttributeError:
+        pass
+    domain = constraint.domain
+    masks = {}
+    def mask(tick, prefix):
+        allowed = domain(tick, prefix)
+        if allowed is None:
+            return None
+        if not isinstance(allowed, frozenset):
+            return pitch_mask(allowed)
+        try:
+            return masks[allowed]
+        except KeyError:
+            masks[allowed] = pitch_mask(allowed)
+            return masks[allowed]
+    return mask
     
-def random_walk_backtracking_w_heuristics(starting_pitch=60,
-        n_events=8, constraints=[lambda x: True], 
-        heuristics=[lambda context,choices,weights: weights]):
-    tick = 0
-    seq = [starting_pitch]
+def _random_bit(mask, rng):
+    """the position of a set bit of mask, chosen uniformly at random"""
+    n_set = bin(mask).count("1")
+    for i in range(rng.randrange(n_set)):
+        # clear the lowest set bit
+        mask = mask & (mask - 1)
+    return (mask & -mask).bit_length() - 1
+    
+def _search(starting_pitch, n_events, constraints, choose, max_dead_paths,
+        stats, voices=(), backjumping=False):
+    """the backtracking search shared by the random_walk_backtracking
+    solvers: choose(tick, choices) picks the next note to try
+    """
+    state = SolverState(starting_pitch, voices)
     if n_events == 1:
-        return cantus(seq)
-    choices = list(range(NOTE_MIN, NOTE_MAX))
-    dead_paths = []
-    while tick < n_events-1:
-        # lets use a very basic random choice to begin with and see how far we go
-        weights= [1.0 for i in range(len(choices))]
-        for heuristic in heuristics:
-            weights = heuristic(tick, choices, weights)
-        try:
-            note = random.choices(choices, weights)[0]
-        except IndexError:
-            # this was thrown because we ran out of choices (we have reached a dead-end)
-            # so you back-track... do it again....
-            dead_paths.append(seq[:])
-            seq = seq[:-1]
-            tick = tick -1
-            choices = list(range(NOTE_MIN, NOTE_MAX))
-            if tick == 0:
-                raise UnsatisfiableException("Unable to solve!")
-                break
+        return cantus(state.pitches)
+    if backjumping:
+        return _backjump_search(state, n_events, constraints, choose, stats)
+    # constraints declaring a domain (see composers.constraints) prune
+    # the choices up front, and need not be called on each note
+    domains = [c.domain for c in constraints if hasattr(c, "domain")]
+    checks = [incremental(c) for c in constraints if not hasattr(c, "domain")]
+    def candidates():
+        choices = list(range(NOTE_MIN, NOTE_MAX))
+        for domain in domains:
+            allowed = domain(state.tick, state.pitches)
+            if allowed is not None:
+                choices = [note for note in choices if note in allowed]
+        return choices
+    choices = candidates()
+    dead_paths = DeadPathIndex(max_dead_paths)
+    dead_paths.push(starting_pitch)
+    nodes = backtracks = max_depth = 0
+    try:
+        while state.tick < n_events-1:
+            # lets use a very basic random choice to begin with and see how far we go
+            try:
+                note = choose(state.tick, choices)
+            except IndexError:
+                # this was thrown because we ran out of choices (we have reached a dead-end)
+                # so you back-track... do it again....
+                if state.tick <= 0:
+                    # the starting pitch is fixed, so there is nothing
+                    # left to back up to
+                    raise UnsatisfiableException("Unable to solve!")
+                dead_paths.add_current()
+                backtracks = backtracks + 1
+                state.pop()
+                dead_paths.pop()
+                # the note just abandoned is now a dead path, so it is
+                # skipped when chosen again
+                choices = candidates()
+                continue
+            nodes = nodes + 1
+            passed = not dead_paths.is_dead(note)
+            if passed and checks:
+                passed = all([check(note, state) for check in checks])
+            if passed:
+                state.push(note)
+                dead_paths.push(note)
+                max_depth = max(max_depth, state.tick)
+                choices = candidates()
             else:
+                #this choice was bad, so we must exclude it
+                choices.remove(note)
+    finally:
+        if stats is not None:
+            stats["nodes"] = nodes
+            stats["backtracks"] = backtracks
+            stats["max_depth"] = max_depth
+            stats["dead_paths"] = len(dead_paths) + dead_paths.evicted
+            stats["dead_paths_evicted"] = dead_paths.evicted
+            stats["dead_paths_nbytes"] = dead_paths.nbytes
+    return cantus(state.pitches)
+
+def _backjump_search(state, n_events, constraints, choose, stats):
+    """conflict-directed backjumping: for each tick, the solver keeps the
+    set of earlier ticks whose notes ruled out any of its choices (its
+    conflict set), found from the ticks each constraint reads (see
+    composers.constraints: a constraint without a lookback is taken to
+    read them all). When a tick runs out of choices, those notes alone
+    are to blame, so the solver jumps back to the latest of them, passing
+    on the rest of the conflict set, and records their pitches as a
+    nogood that rules them out together from then on.
+    """
+    domains = [(c.domain, getattr(c, "lookback", None))
+        for c in constraints if hasattr(c, "domain")]
+    checks = [(incremental(c), getattr(c, "lookback", None))
+        for c in constraints if not hasattr(c, "domain")]
+    # (tick, pitch) -> the other (tick, pitch) pairs of each nogood
+    # learned at that tick
+    nogoods = {}
+    n_nogoods = 0
+    def reads(tick, lookback):
+        if lookback is None:
+            return range(tick)
+        if callable(lookback):
+            return list(lookback(tick))
+        return range(max(tick - lookback, 0), tick)
+    def candidates(conflicts):
+        """the notes allowed at this tick. For each note ruled out, the
+        ticks read by whichever constraint (or nogood) rules it out with
+        the earliest notes are added to conflicts, to jump back as far
+        as possible.
+        """
+        tick = state.tick
+        tests = []
+        for domain, lookback in domains:
+            allowed = domain(tick, state.pitches)
+            if allowed is not None:
+                tests.append((reads(tick, lookback), allowed.__contains__))
+        for check, lookback in checks:
+            tests.append((reads(tick, lookback),
+                lambda note, check=check: check(note, state)))
+        tests.sort(key=lambda test: max(test[0], default=-1))
+        choices = []
+        for note in range(NOTE_MIN, NOTE_MAX):
+            reason = None
+            for others in nogoods.get((tick, note), ()):
+                if all(state.pitches[t+1] == pitch for (t, pitch) in others):
+                    ticks = [t for (t, pitch) in others]
+                    if reason is None or max(ticks, default=-1) < max(reason, default=-1):
+                        reason = ticks
+            for ticks, test in tests:
+                if reason is not None and max(ticks, default=-1) >= max(reason, default=-1):
+                    break
+                if not test(note):
+                    reason = ticks
+                    break
+            if reason is None:
+                choices.append(note)
+            else:
+                conflicts.update(reason)
+        return choices
+    # the remaining choices and the conflict set of each tick so far
+    conflict_sets = [set()]
+    choice_sets = [candidates(conflict_sets[-1])]
+    nodes = backtracks = max_depth = 0
+    try:
+        while state.tick < n_events-1:
+            try:
+                note = choose(state.tick, choice_sets[-1])
+            except IndexError:
+                conflicts = conflict_sets.pop()
+                choice_sets.pop()
+                if not conflicts:
+                    raise UnsatisfiableException("Unable to solve!")
+                culprit = max(conflicts)
+                nogood = sorted((t, state.pitches[t+1]) for t in conflicts)
+                nogoods.setdefault(nogood[-1], []).append(nogood[:-1])
+                n_nogoods = n_nogoods + 1
+                backtracks = backtracks + 1
+                while state.tick > culprit:
+                    note = state.pop()
+                    if state.tick > culprit:
+                        conflict_sets.pop()
+                        choice_sets.pop()
+                choice_sets[-1].remove(note)
+                conflict_sets[-1].update(conflicts)
+                conflict_sets[-1].discard(culprit)
                 continue
-        context = (note, cantus(seq + [note]), tick)
-        results = set()
-        for constraint in constraints:
-            results.update([constraint(context)])
-        candidate = seq[:]
-        candidate.append(note)
-        if results == {True} and candidate not in dead_paths:
-            seq.append(note)
-            tick = tick + 1
-            choices = list(range(NOTE_MIN, NOTE_MAX))
-        else:
-            #this choice was bad, so we must exclude it
-            choices.remove(note)
-    return cantus(seq)
-    pass
\ No newline at end of file
+            nodes = nodes + 1
+            state.push(note)
+            max_depth = max(max_depth, state.tick)
+            conflict_sets.append(set())
+            choice_sets.append(candidates(conflict_sets[-1]))
+    finally:
+        if stats is not None:
+            stats["nodes"] = nodes
+            stats["backtracks"] = backtracks
+            stats["max_depth"] = max_depth
+            stats["nogoods"] = n_nogoods
+    return cantus(state.pitches)
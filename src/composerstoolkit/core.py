@@ -1,13 +1,51 @@
+import bisect
 from collections import namedtuple
+import collections.abc
+import hashlib
+import heapq
 import itertools
-from time import sleep
+import weakref
+import time
 
-from midiutil.MidiFile import MIDIFile
 from toolz import pipe as pipe
 from infix import or_infix
 
+from .midifile import BUFFER_SIZE as MIDI_BUFFER_SIZE, write_midi_file
+from .playback import AsyncPlayback, Scheduler, seconds_per_beat
+
 class NotChainableException(Exception): pass
 
+# how CTSequence records its memento, see composerstoolkit.history
+_history_policy = None
+
+# memoizes transformer applications, see set_transform_cache
+_transform_cache = None
+
+# times transformer applications, see composerstoolkit.instrumentation
+_profiler = None
+
+def set_profiler(profiler):
+    """Report every transformer applied (and every plain function
+    chained onto a CTSequence) to profiler (eg. an
+    instrumentation.Profiler), or stop reporting if None (the default).
+    Returns the previous profiler.
+    """
+    global _profiler
+    previous = _profiler
+    _profiler = profiler
+    return previous
+
+def set_history_policy(policy):
+    """Set the policy used to store the memento of every CTSequence
+    created from now on (eg. history.KeepLast(10)). None restores the
+    default, which keeps every ancestor.
+    Returns the previous policy.
+    """
+    global _history_policy
+    previous = _history_policy
+    _history_policy = policy
+    return previous
+
 @or_infix
 def chain(a,b):
     try:
@@ -16,27 +54,82 @@ def chain(a,b):
         raise NotChainableException(
             "object {} is not chainable".format(str(a)))
 
-_ctevent = namedtuple("ctevent", ["pitches", "duration"])
-
-class CTEvent(_ctevent):
+class CTEvent():
+    """An immutable musical event: a (possibly empty) set of pitches
+    sounding together for a duration.
+    
+    Pitches are held as a tuple, which the pitches property returns
+    as is (it compares equal to a list of the same pitches). Events are
+    hashable, and CTEvent.interned() returns a shared instance for each
+    distinct event.
+    """
+    __slots__ = ["_pitches", "_duration", "__weakref__"]
     
-    def __new__(cls, pitches=None, duration=0):
-        if pitches is None:
-            pitches = []
-        elif isinstance(pitches, int):
-            pitches = [pitches]
-        return _ctevent.__new__(cls, pitches, duration)
+    _interned = weakref.WeakValueDictionary()
+    
+    def __init__(self, pitches=None, duration=0):
+        object.__setattr__(self, "_pitches", _as_pitch_tuple(pitches))
+        object.__setattr__(self, "_duration", duration)
+        
+    @classmethod
+    def interned(cls, pitches=None, duration=0):
+        """Return the shared instance of CTEvent(pitches, duration),
+        creating it if need be. Interned events live for as long as
+        something refers to them.
+        """
+        pitches = _as_pitch_tuple(pitches)
+        # the types keep eg. pitches or durations of 1 and 1.0 apart
+        key = (pitches, tuple(map(type, pitches)), duration, type(duration))
+        event = cls._interned.get(key)
+        if event is None:
+            event = cls(pitches, duration)
+            cls._interned[key] = event
+        return event
     
     @property
     def pitches(self):
-        return self[0]
+        return self._pitches
     
     @property
     def duration(self):
-        return self[1]
+        return self._duration
+        
+    def __iter__(self):
+        yield self._pitches
+        yield self._duration
+        
+    def __len__(self):
+        return 2
+        
+    def __getitem__(self, index):
+        return (self.pitches, self._duration)[index]
+        
+    def __eq__(self, other):
+        if isinstance(other, CTEvent):
+            return (tuple.__eq__(self._pitches, other._pitches)
+                and self._duration == other._duration)
+        if isinstance(other, tuple):
+            return tuple(self) == other
+        return NotImplemented
+        
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+        
+    def __hash__(self):
+        return hash((self._pitches, self._duration))
+        
+    def __reduce__(self):
+        return (CTEvent, (self._pitches, self._duration))
+    
+    def __repr__(self):
+        return "CTEvent(pitches={0}, duration={1!r})".format(
+            list(self._pitches), self._duration)
     
     def __str__(self):
-        return "<CTEvent {0}, {1}>".format(self.pitches, self.duration)
+        return "<CTEvent {0}, {1}>".format(list(self._pitches), self._duration)
     
     def __add__(self, other):
         return CTSequence([self, other])
@@ -46,86 +139,432 @@ class CTEvent(_ctevent):
     
     def __delattr__(self, *ignored):
         raise NotImplementedError
+        
+class _Pitches(tuple):
+    """The pitches of a CTEvent: a tuple that also compares equal to a
+    list of the same pitches, as CTEvent.pitches was once a list.
+    """
+    __slots__ = ()
     
+    def __eq__(self, other):
+        if isinstance(other, list):
+            return tuple.__eq__(self, tuple(other))
+        return tuple.__eq__(self, other)
     
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+    
+    __hash__ = tuple.__hash__
+    
+    def __reduce__(self):
+        return (_Pitches, (tuple(self),))
+
+_NO_PITCHES = _Pitches()
+
+def _as_pitch_tuple(pitches):
+    if pitches is None:
+        return _NO_PITCHES
+    if type(pitches) is _Pitches:
+        return pitches
+    if isinstance(pitches, int):
+        return _Pitches((pitches,))
+    try:
+        return _Pitches(pitches)
+    except TypeError:
+        # a single, non-int pitch
+        return _Pitches((pitches,))
+    
+def _encode_number(x):
+    """a canonical encoding of a pitch or duration, such that numbers
+    that compare equal (eg. 1, 1.0 and Fraction(1)) encode alike
+    """
+    try:
+        if x == int(x):
+            return str(int(x))
+        if x == float(x):
+            return float(x).hex()
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return repr(x)
+
+def _encode_event(event):
+    return "{}:{};".format(
+        ",".join([_encode_number(p) for p in event.pitches]),
+        _encode_number(event.duration)).encode("ascii", "backslashreplace")
+
 midievent = namedtuple("midievent", ["pitch", "type", "time"])
+
+def iter_midi_events(events, time_offset=0):
+    """Yield the NOTE_ON and NOTE_OFF midievents for an iterable of
+    CTEvents in chronological order. Only the note-offs still pending
+    are held in memory, so events may be an unbounded iterator.
+    Events that fall at the same time come out in the order they were
+    generated (ie, as a stable sort by time would leave them).
+    """
+    pending = [] # heap of (time, count, midievent)
+    count = 0
+    for e in events:
+        end = time_offset + e.duration
+        for pitch in e.pitches:
+            if e.duration > 0:
+                # everything still pending ends after time_offset
+                yield midievent(pitch, "NOTE_ON", time_offset)
+            else:
+                heapq.heappush(pending,
+                    (time_offset, count, midievent(pitch, "NOTE_ON", time_offset)))
+            heapq.heappush(pending,
+                (end, count + 1, midievent(pitch, "NOTE_OFF", end)))
+            count = count + 2
+        time_offset = end
+        while pending and pending[0][0] <= time_offset:
+            yield heapq.heappop(pending)[2]
+    while pending:
+        yield heapq.heappop(pending)[2]
+
+class EventStore(collections.abc.Sequence):
+    """Base class for read-only containers of CTEvents that can stand
+    in for the plain list held in CTSequence.events (see
+    composerstoolkit.columnar, and CopyOnWriteStore for those that can
+    be changed).
+    They compare equal to any list of the same events.
+    """
     
+    # whether slicing returns a view sharing this store's data, rather
+    # than a copy (see composerstoolkit.views)
+    shares_slices = False
+    
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, EventStore)):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        return all(a == b for a, b in zip(self, other))
+        
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+        
+    __hash__ = None
+        
+    def __add__(self, other):
+        return list(self) + list(other)
+        
+    def __radd__(self, other):
+        return list(other) + list(self)
+        
+    def __repr__(self):
+        return repr(list(self))
+        
+    def materialize(self):
+        return list(self)
+
+class CopyOnWriteStore(EventStore, collections.abc.MutableSequence):
+    """Base class for event stores that share their events with other
+    stores (see composerstoolkit.rope and composerstoolkit.views), but
+    can still be changed like a list: the first change copies the
+    events out into a list of the store's own, leaving the shared
+    events as they were.
+
+    Subclasses read their shared events in _shared_len(),
+    _shared_getitem() and _shared_iter(), take them back from a tuple
+    in _share_events(events), and return a new store sharing them in
+    _shared_copy().
+    """
+
+    # the list of events, once changed
+    _copy = None
+
+    def snapshot(self):
+        """a new store of the events as they are now, sharing them
+        with this one, which may go on to change without affecting it
+        """
+        self._freeze()
+        return self._shared_copy()
+
+    def _freeze(self):
+        """share the changed events (if any) again"""
+        if self._copy is not None:
+            self._share_events(tuple(self._copy))
+            self._copy = None
+
+    def _own(self):
+        if self._copy is None:
+            self._copy = list(self._shared_iter())
+        return self._copy
+
+    def __len__(self):
+        if self._copy is not None:
+            return len(self._copy)
+        return self._shared_len()
+
+    def __getitem__(self, index):
+        if self._copy is not None:
+            return self._copy[index]
+        return self._shared_getitem(index)
+
+    def __iter__(self):
+        if self._copy is not None:
+            return iter(self._copy)
+        return self._shared_iter()
+
+    def __setitem__(self, index, value):
+        self._own()[index] = value
+
+    def __delitem__(self, index):
+        del self._own()[index]
+
+    def insert(self, index, value):
+        self._own().insert(index, value)
+
+    def append(self, value):
+        self._own().append(value)
+
+    def extend(self, values):
+        self._own().extend(values)
+
 class CTSequence():
     
     def __init__(self, events, memento=None):
         self.events = events
         self.memento = memento
+        self._index = None
+        self._index_key = None
+        self._digest_state = None
+        
+    @property
+    def memento(self):
+        link = self._memento
+        if link is None or isinstance(link, CTSequence):
+            return link
+        return link.resolve(self)
+        
+    @memento.setter
+    def memento(self, memento):
+        if _history_policy is None or memento is None:
+            self._memento = memento
+        else:
+            self._memento = _history_policy.link(self, memento)
+            
+    def history(self):
+        """Yield the mementos of this sequence, most recent first"""
+        seq = self.memento
+        while seq is not None:
+            yield seq
+            seq = seq.memento
+            
+    def trim_history(self, n=0):
+        """Discard all but the n most recent mementos. Note that
+        ancestors shared with other sequences are trimmed for those
+        sequences too.
+        """
+        self._memento = _trim_link(self._memento, n)
     
     def chain(self, f):
-        new_events = f(self)
+        profiler = _profiler
+        if profiler is not None and not hasattr(f, "transformer"):
+            # (CTTransformers report themselves)
+            new_events = profiler.measure(
+                getattr(f, "__name__", repr(f)), f, self)
+        else:
+            new_events = f(self)
         return CTSequence(new_events, self)
         
     def to_midi_events(self, time_offset=0):
-        results = []
-        for e in self.events:
-            for pitch in e.pitches:
-                results.append(midievent(
-                    pitch = pitch,
-                    type = "NOTE_ON",
-                    time = time_offset
-                ))
-                results.append(midievent(
-                    pitch = pitch,
-                    type = "NOTE_OFF",
-                    time = time_offset + e.duration
-                ))
-            time_offset = time_offset + e.duration
-        results.sort(key=lambda x: x.time, reverse=False)
-        return results
+        return list(iter_midi_events(self.events, time_offset))
         
     @property
     def pitches(self):
-        return list(itertools.chain.from_iterable([e.pitches for e in self.events]))
+        try:
+            return self.events.pitches
+        except AttributeError:
+            return list(itertools.chain.from_iterable([e.pitches for e in self.events]))
     
     @property
     def durations(self):
-        return [e.duration for e in self.events]
+        try:
+            return self.events.durations
+        except AttributeError:
+            return [e.duration for e in self.events]
         
     def to_pitch_set(self):
-        return {* (itertools.chain.from_iterable([e.pitches for e in self.events]))}
+        try:
+            return self.events.to_pitch_set()
+        except AttributeError:
+            return {* (itertools.chain.from_iterable([e.pitches for e in self.events]))}
+            
+    def to_columnar(self):
+        """Return a copy of this sequence whose events are held in
+        flat NumPy arrays (see composerstoolkit.columnar.ColumnarEvents)
+        """
+        from .columnar import ColumnarEvents
+        return CTSequence(ColumnarEvents.from_events(self.events))
+        
+    def lazy(self):
+        """Return a LazySequence wrapping this sequence, which records
+        chained transformations and only runs them once its events
+        are needed (see composerstoolkit.lazy)
+        """
+        from .lazy import LazySequence
+        return LazySequence(self)
         
     def to_pitch_class_set(self):
         pitch_set = self.to_pitch_set()
         return {*[p % 12 for p in pitch_set]}
         
+    def _end_times(self):
+        """Prefix sums of the event durations, ie the time at which
+        each event ends. This is cached, and rebuilt if the events
+        are replaced by another object or change length. Replacing
+        events in place (with the same length) is not detected.
+        """
+        key = self._index_key
+        if (key is None or key[0] is not self.events
+                or key[1] != len(self.events)):
+            self._index = list(itertools.accumulate(self.durations))
+            # the events themselves are kept (rather than their id),
+            # as a new object may reuse the id of a freed one
+            self._index_key = (self.events, len(self.events))
+        return self._index
+        
+    def digest(self):
+        """A stable (across processes and sessions) hash of the events
+        of this sequence, as a hex string. Sequences with equal events
+        have equal digests; the memento plays no part.
+        
+        The digest is cached, and when events are appended to the same
+        list, only the new events are hashed. Replacing events in
+        place is not detected.
+        """
+        events = self.events
+        n = len(events)
+        state = self._digest_state
+        if state is not None and state[0] is events and state[1] == n:
+            return state[3]
+        if state is not None and state[0] is events and state[1] < n:
+            hasher = state[2].copy()
+            new_events = itertools.islice(self.events, state[1], None)
+        else:
+            hasher = hashlib.blake2b(digest_size=16)
+            new_events = self.events
+        for event in new_events:
+            hasher.update(_encode_event(event))
+        digest = hasher.hexdigest()
+        self._digest_state = (events, n, hasher, digest)
+        return digest
+        
     def lookup(self, offset=0):
+        """Return the event sounding at the given offset. An event
+        spans (start, end], save the first, which also covers 0.
+        """
         if offset < 0:
             return None
-        for e in self.events:
-            if e.duration >= offset:
-                return e
-            offset = offset - e.duration
-        return None
+        end_times = self._end_times()
+        i = bisect.bisect_left(end_times, offset)
+        if i == len(end_times):
+            return None
+        return self.events[i]
+        
+    def lookup_range(self, start, end):
+        """Return the events sounding at any point between the
+        offsets start and end (inclusive), under the same
+        convention as lookup()
+        """
+        if end < 0 or end < start:
+            return self.events[0:0]
+        end_times = self._end_times()
+        i = bisect.bisect_left(end_times, max(start, 0))
+        j = bisect.bisect_left(end_times, end)
+        return self.events[i:j+1]
         
     def __getitem__(self, slice):
+        """a CTSequence of the sliced events. If the events are a list,
+        so are those of the slice; otherwise (eg. the result of
+        retrograde or rotate) the slice is a read-only view onto them
+        (see composerstoolkit.views)
+        """
+        from .views import view
+        events = view(self.events)
         start, stop, step = None, None, None
         try:
             start, stop, step = slice
-            sliced_events = self.events[start:stop:step]
+            sliced_events = events[start:stop:step]
         except TypeError:
             try:
                 start, stop = slice
-                sliced_events = self.events[start:stop]
+                sliced_events = events[start:stop]
             except TypeError:
                 start = slice
-                sliced_events = self.events[start]
-                if not isinstance(sliced_events , list):
+                sliced_events = events[start]
+                if isinstance(sliced_events, CTEvent):
                     sliced_events = [sliced_events]
         
         return CTSequence(sliced_events, self)
         
+    def __eq__(self, other):
+        if not isinstance(other, CTSequence):
+            return NotImplemented
+        if self is other:
+            return True
+        # the digests tell most unequal sequences apart cheaply, but a
+        # stale digest (or a collision) must not make a false match
+        return (len(self.events) == len(other.events)
+            and self.digest() == other.digest()
+            and all(a == b for (a, b) in zip(self.events, other.events)))
+            
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+        
+    def __hash__(self):
+        # nb. a sequence used as a key should not have its events changed
+        return int(self.digest()[:16], 16)
+        
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # hashlib objects cannot be pickled
+        state["_digest_state"] = None
+        return state
+        
     def __str__(self):
         return "<CTSequence {}>".format(self.events)
         
     def __add__(self, other):
-        events = self.events[:] + other.events[:]
-        return CTSequence(events)
+        """The events of self followed by those of other. Rather than
+        copying both, the result shares them through an EventRope
+        (see composerstoolkit.rope).
+        """
+        from .rope import EventRope
+        return CTSequence(EventRope.concat(self.events, other.events))
+    
     
+def _parent_link(link):
+    if isinstance(link, CTSequence):
+        return link._memento
+    return link.parent_link
+    
+def _trim_link(link, n):
+    """Return the history link 'link' with everything older than n
+    generations cut off.
+    """
+    links = []
+    while link is not None and len(links) < n:
+        links.append(link)
+        link = _parent_link(link)
+    parent = None
+    for link in reversed(links):
+        if isinstance(link, CTSequence):
+            link._memento = parent
+        else:
+            link = link.with_parent(parent)
+        parent = link
+    return parent
     
 def CTGenerator(functor):
     def getConfig(*args, **kwargs):
@@ -152,16 +591,113 @@ def withrepr(reprfun):
         return reprwrapper(reprfun, func)
     return _wrap
     
+def set_transform_cache(cache):
+    """Memoize the results of pure CTTransformers applied to
+    CTSequences in cache (eg. a TransformCache), or stop memoizing if
+    None (the default).
+    Returns the previous cache.
+    """
+    global _transform_cache
+    previous = _transform_cache
+    _transform_cache = cache
+    return previous
+    
+class TransformCache():
+    """A bounded, least-recently-used store of transformer results,
+    keyed by the transformer, its arguments and the content hash of the
+    input sequence (see set_transform_cache)
+    """
+    
+    def __init__(self, maxsize=1024):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        
+    def get(self, key):
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses = self.misses + 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits = self.hits + 1
+        return value
+        
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        
+    def __len__(self):
+        return len(self._entries)
+        
+    def __str__(self):
+        return "<TransformCache {}/{} entries, {} hits, {} misses>".format(
+            len(self), self.maxsize, self.hits, self.misses)
+        
 class CTTransformer():
     
-    def __init__(self, functor):
+    def __init__(self, functor, pure=True):
         self._functor = functor
+        self.kernel = None
+        # impure transformers (eg. those using random) are never memoized
+        self.pure = pure
+        
+    @classmethod
+    def impure(cls, functor):
+        """decorator for transformers whose results are not determined
+        by their input and arguments alone
+        """
+        return cls(functor, pure=False)
+        
+    def fuse_with(self, kernel_factory):
+        """Register a per-event kernel for this transformer, allowing
+        it to be fused with its neighbours in a lazy pipeline
+        (see composerstoolkit.lazy). Can be used as a decorator.
+        """
+        self.kernel = kernel_factory
+        return kernel_factory
     
     def __call__(self, *args, **kwargs):
         @withrepr(
             lambda x: "<CTTransformer: {}{}>".format(
                 self._functor.__name__, args + tuple(kwargs.items())))
         def transform(instance):
+            profiler = _profiler
+            if profiler is None:
+                return memoized(instance)
+            return profiler.measure(self._functor.__name__, memoized, instance)
+        def memoized(instance):
+            cache = _transform_cache
+            if cache is None or not self.pure or not isinstance(instance, CTSequence):
+                return apply(instance)
+            try:
+                # the type of the events is included as eg. columnar
+                # input gives columnar output
+                key = (self, args, tuple(sorted(kwargs.items())),
+                    type(instance.events), instance.digest())
+                hash(key)
+            except TypeError:
+                # eg. a list argument
+                return apply(instance)
+            cached = cache.get(key)
+            if cached is not None:
+                return _copy_events(cached)
+            result = apply(instance)
+            if isinstance(result, (list, EventStore)):
+                # (not generators, which can only be consumed once)
+                cache.put(key, _copy_events(result))
+            return result
+        def apply(instance):
             nonlocal args
             nonlocal kwargs
             _kwargs = kwargs
@@ -172,27 +708,47 @@ class CTTransformer():
                 return gate(self._functor, instance, *_args, **_kwargs)
             _args = [instance] + list(args)
             return self._functor(*_args, **_kwargs)
+        transform.transformer = self
+        transform.args = args
+        transform.kwargs = kwargs
         return transform
     
     def __str__(self):
         return "<CTTransformer : {}>".format(self._functor.__name__)
     
+def _copy_events(events):
+    # other event stores are read-only, so need no copy
+    if isinstance(events, list):
+        return events[:]
+    if isinstance(events, CopyOnWriteStore):
+        return events.snapshot()
+    return events
+    
 def boolean_gate(gate):
     def transform(functor, instance, *args, **kwargs):
         nonlocal gate
+        # both timelines only move forwards, so rather than looking up
+        # the gate at each offset, walk it alongside the input
+        gate_events = iter(gate.events)
+        cur_gate_event = next(gate_events, None)
+        gate_offset = 0 if cur_gate_event is None else cur_gate_event.duration
         offset = 0
         result = []
         buffer = [] #toggle state, sequence
         past_toggle_state = False
-        for i in range(len(instance.events)):
-            e = instance.events[i]
+        cur_toggle_state = False
+        for i, e in enumerate(instance.events):
             offset = offset + e.duration
-            cur_gate_event = gate.lookup(offset)
+            # advance to the gate event sounding at this offset
+            while cur_gate_event is not None and gate_offset < offset:
+                cur_gate_event = next(gate_events, None)
+                if cur_gate_event is not None:
+                    gate_offset = gate_offset + cur_gate_event.duration
             
-            if cur_gate_event is None:
+            if cur_gate_event is None or offset < 0:
                 # # there is no event at this offset
                 # # just append 'e' to result
-                buffer = buffer + [e]
+                buffer.append(e)
                 past_toggle_state = False
                 continue
             
@@ -201,21 +757,19 @@ def boolean_gate(gate):
             
             if not has_changed or i == 0:
                 # no change, just add to the buffer
-                buffer = buffer + [e]
+                buffer.append(e)
             
             elif has_changed and cur_toggle_state:
                 # the gate has changed to 'on'
                 # add the buffer to result
-                result = result + buffer
+                result.extend(buffer)
                 buffer = [e]
             
             elif has_changed and not cur_toggle_state and i:
                 # the gate has changed to 'off'
                 # transform the contents of buffer
                 _args = [CTSequence(buffer)] + list(args)
-                buffer = functor(*_args, **kwargs)
-                # add to result
-                result = result + buffer
+                result.extend(functor(*_args, **kwargs))
                 buffer = [e]
                 
             past_toggle_state = cur_toggle_state
@@ -225,12 +779,10 @@ def boolean_gate(gate):
             # there are items left in the buffer
             # state is ON is transform and add to result
             _args = [CTSequence(buffer)] + list(args)
-            buffer = functor(*_args, **kwargs)
+            result.extend(functor(*_args, **kwargs))
+        elif len(buffer):
             # no transform, just add to result
-            result = result + buffer
-        if len(buffer) and not cur_toggle_state:
-            # add to result
-            result = result + buffer
+            result.extend(buffer)
         return result
     return transform
     
@@ -250,39 +802,68 @@ class Container():
         self.sequences.append((channel_no, offset, seq))
         
     def get_playback_events(self):
+        return list(self.iter_playback_events())
+        
+    def iter_playback_events(self):
+        """Yield the midievents of all sequences in chronological order.
+        Each sequence produces an ordered stream of its own, and these
+        are merged lazily, so the first events are available straight
+        away (and sequences may be unbounded CTStreams).
+        """
+        return (me for (channel_no, me) in self.iter_channel_events())
+        
+    def iter_channel_events(self):
+        """As iter_playback_events, but yielding (channel_no, midievent)"""
         playback_rate = self.options["playback_rate"]
-        all_midi_events = []
-        for (channel_no, offset,seq) in self.sequences:
-            for me in seq.to_midi_events(offset):
-                all_midi_events.append(midievent(me.pitch, me.type, me.time / playback_rate))
-        all_midi_events = sorted(all_midi_events, key=lambda x: x.time)
-        return all_midi_events
-        
-    def playback(self, player_func, dynamic=60):
-        playback_events = self.get_playback_events()
-        #nb the events are chronologically ordered
-        count = 0
-        for event in playback_events:
-            if event.time != count:
-                sleep(event.time - count)
-            count = event.time
+        def scaled(channel_no, events):
+            for me in events:
+                yield (channel_no, midievent(me.pitch, me.type, me.time / playback_rate))
+        # ties keep the order in which the sequences were added
+        return heapq.merge(
+            *[scaled(channel_no, iter_midi_events(seq.events, offset))
+                for (channel_no, offset, seq) in self.sequences],
+            key=lambda x: x[1].time)
+        
+    def playback(self, player_func, dynamic=60, clock=time.monotonic, sleep=time.sleep):
+        """Play the container in real time through player_func (eg. a
+        fluidsynth.Synth), sending each sequence on its own channel.
+        Event times are in beats, at the container's bpm.
+        Returns a playback.PlaybackStats recording how late each event
+        was dispatched.
+        """
+        def dispatch(channel_no, event):
             if event.type == "NOTE_ON":
-                player_func.noteon(0, event.pitch, dynamic)
+                player_func.noteon(channel_no, event.pitch, dynamic)
             elif event.type == "NOTE_OFF":
-                player_func.noteoff(0, event.pitch)
+                player_func.noteoff(channel_no, event.pitch)
+        scheduler = Scheduler(clock, sleep)
+        return scheduler.run(
+            self.iter_channel_events(),
+            dispatch,
+            seconds_per_beat(self.options["bpm"]))
+
+    def playback_async(self, player_func, dynamic=60, clock=None):
+        """As playback, but without blocking: returns a
+        playback.AsyncPlayback, which plays the container once started
+        (or awaited) on the running asyncio event loop, and can be
+        paused, resumed, seeked and stopped meanwhile.
+        """
+        return AsyncPlayback(self, player_func, dynamic, clock)
                 
     def save_as_midi_file(self, filename, dynamic=60):
-        mf = MIDIFile(len(self.sequences))
-        for (channel_no, offset, seq) in self.sequences:
-            mf.addTrackName(channel_no, offset, "Channel {}".format(channel_no))
-            count = offset
-            for event in seq.events:
-                for pitch in event.pitches:
-                    mf.addNote(channel_no, 0, pitch, count, event.duration, dynamic)
-                count = count + event.duration
-        # mf.addTempo(0, 0, self.options["bpm"])
-        with open(filename, 'wb') as outf:
-            mf.writeFile(outf)
+        """Write the container as a format 1 MIDI file (to a filename,
+        or a binary file object), with one track per sequence on that
+        sequence's channel (modulo 16), at the container's bpm.
+        """
+        tracks = [
+            (channel_no % 16, "Channel {}".format(channel_no),
+                iter_midi_events(seq.events, offset))
+            for (channel_no, offset, seq) in self.sequences]
+        if hasattr(filename, "write"):
+            write_midi_file(filename, tracks, self.options["bpm"], dynamic)
+            return
+        with open(filename, 'wb', buffering=MIDI_BUFFER_SIZE) as outf:
+            write_midi_file(outf, tracks, self.options["bpm"], dynamic)
         
 class Vertex(object):
     """
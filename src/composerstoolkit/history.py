@@ -0,0 +1,144 @@
+"""
+Policies controlling how much of a CTSequence's history (its chain of
+mementos) is kept alive. Install one with core.set_history_policy, eg:
+
+    set_history_policy(KeepLast(8))
+
+Every CTSequence created afterwards stores its memento according to
+that policy; sequence.history() walks what is left of the chain and
+sequence.trim_history(n) cuts it back by hand.
+"""
+import weakref
+
+from .core import CTSequence, _trim_link
+
+class KeepAll():
+    """Keep a strong reference to every ancestor (the default)"""
+
+    def link(self, seq, memento):
+        return memento
+
+class NoHistory():
+    """Do not record mementos at all"""
+
+    def link(self, seq, memento):
+        return None
+
+class KeepLast():
+    """Keep only the n most recent ancestors of each new sequence"""
+
+    def __init__(self, n=1):
+        if n < 0:
+            raise ValueError("n cannot be less than 0")
+        self.n = n
+
+    def link(self, seq, memento):
+        return _trim_link(memento, self.n)
+
+class WeakHistory():
+    """Reference the previous sequence weakly, so the memento
+    becomes None once nothing else holds on to it
+    """
+
+    def link(self, seq, memento):
+        return _WeakLink(memento)
+
+class DeltaHistory():
+    """Rather than the previous sequence itself, store only the
+    run of events that differ between it and the new sequence (the
+    common head and tail are recovered from the new sequence on
+    demand). Every snapshot_every'th generation, the events are stored
+    in full, so that an ancestor can still be rebuilt without every
+    descendant. If limit is given, only that many generations are kept.
+
+    Rebuilt mementos are equal to, but not the same objects as, the
+    original sequences.
+    """
+
+    def __init__(self, snapshot_every=8, limit=None):
+        if snapshot_every < 1:
+            raise ValueError("snapshot_every must be at least 1")
+        self.snapshot_every = snapshot_every
+        self.limit = limit
+
+    def link(self, seq, memento):
+        parent_link = memento._memento
+        if self.limit is not None:
+            parent_link = _trim_link(parent_link, self.limit - 1)
+        depth = getattr(parent_link, "depth", 0) + 1
+        if depth % self.snapshot_every == 0:
+            return _SnapshotLink(memento.events, parent_link, depth)
+        return _DeltaLink.between(seq.events, memento.events, parent_link, depth)
+
+class _WeakLink():
+
+    def __init__(self, seq):
+        self._ref = weakref.ref(seq)
+
+    def resolve(self, seq):
+        return self._ref()
+
+    @property
+    def parent_link(self):
+        parent = self._ref()
+        if parent is None:
+            return None
+        return parent._memento
+
+    def with_parent(self, parent_link):
+        parent = self._ref()
+        if parent is not None:
+            parent._memento = parent_link
+        return self
+
+class _SnapshotLink():
+    __slots__ = ["events", "parent_link", "depth"]
+
+    def __init__(self, events, parent_link, depth):
+        self.events = events
+        self.parent_link = parent_link
+        self.depth = depth
+
+    def resolve(self, seq):
+        parent = CTSequence(self.events)
+        parent._memento = self.parent_link
+        return parent
+
+    def with_parent(self, parent_link):
+        return _SnapshotLink(self.events, parent_link, self.depth)
+
+class _DeltaLink():
+    __slots__ = ["head", "tail", "middle", "parent_link", "depth"]
+
+    def __init__(self, head, tail, middle, parent_link, depth):
+        self.head = head
+        self.tail = tail
+        self.middle = middle
+        self.parent_link = parent_link
+        self.depth = depth
+
+    @classmethod
+    def between(cls, events, parent_events, parent_link, depth):
+        """describe parent_events as a change to events"""
+        n, m = len(events), len(parent_events)
+        limit = min(n, m)
+        head = 0
+        while head < limit and events[head] == parent_events[head]:
+            head = head + 1
+        tail = 0
+        while tail < limit - head and events[n-1-tail] == parent_events[m-1-tail]:
+            tail = tail + 1
+        middle = list(parent_events[head:m-tail])
+        return cls(head, tail, middle, parent_link, depth)
+
+    def resolve(self, seq):
+        events = seq.events
+        parent = CTSequence(
+            list(events[:self.head])
+            + self.middle
+            + list(events[len(events)-self.tail:]))
+        parent._memento = self.parent_link
+        return parent
+
+    def with_parent(self, parent_link):
+        return _DeltaLink(self.head, self.tail, self.middle, parent_link, self.depth)
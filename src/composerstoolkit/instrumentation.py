@@ -0,0 +1,159 @@
+"""
+Profiling of transformer pipelines, eg:
+
+    with Profiler() as profiler:
+        result = seq |chain| transpose(2) |chain| retrograde() |chain| loop(4)
+    print(profiler.table())
+    profiler.save_chrome_trace("pipeline.json")
+
+While a profiler is installed (see core.set_profiler), every
+CTTransformer application, and every plain function chained onto a
+CTSequence, is timed. The cost when no profiler is installed is a
+single check per transformation.
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from . import core
+
+class TransformerStats():
+    """The totals recorded for one transformer name"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total_time = 0.0
+        self.events_in = 0
+        self.events_out = 0
+        self.allocated_bytes = 0
+
+    @property
+    def mean_time(self):
+        if self.calls == 0:
+            return 0.0
+        return self.total_time / self.calls
+
+    def __str__(self):
+        return "<TransformerStats {} calls={} total_time={:.6f}s>".format(
+            self.name, self.calls, self.total_time)
+
+class Profiler():
+    """Records the call count, wall time, number of events in and out
+    and, if trace_memory, the net bytes allocated (and still held once
+    the call returns, as measured by tracemalloc) of each transformer,
+    by name. Each call is also kept as a trace event (unless
+    keep_trace is False) for export to the Chrome trace-event format.
+
+    Can be used as a context manager, which installs the profiler on
+    entry and restores the previous one on exit.
+    """
+
+    def __init__(self, trace_memory=False, keep_trace=True):
+        self.trace_memory = trace_memory
+        self.keep_trace = keep_trace
+        self.stats = {}
+        self.trace = []
+        self._epoch = time.perf_counter()
+        self._previous = None
+        self._started_tracemalloc = False
+
+    def measure(self, name, func, seq):
+        """call func(seq), recording it under name, and return the
+        result
+        """
+        n_in = _count(getattr(seq, "events", None))
+        if self.trace_memory:
+            memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = func(seq)
+        end = time.perf_counter()
+        allocated = 0
+        if self.trace_memory:
+            allocated = tracemalloc.get_traced_memory()[0] - memory_before
+        self.record(name, start, end, n_in, _count(result), allocated)
+        return result
+
+    def record(self, name, start, end, events_in, events_out, allocated_bytes=0):
+        try:
+            stats = self.stats[name]
+        except KeyError:
+            stats = self.stats[name] = TransformerStats(name)
+        stats.calls = stats.calls + 1
+        stats.total_time = stats.total_time + (end - start)
+        stats.events_in = stats.events_in + (events_in or 0)
+        stats.events_out = stats.events_out + (events_out or 0)
+        stats.allocated_bytes = stats.allocated_bytes + allocated_bytes
+        if self.keep_trace:
+            self.trace.append((name, start, end, events_in, events_out,
+                allocated_bytes, threading.get_ident()))
+
+    def rows(self):
+        """the TransformerStats of every transformer, slowest first"""
+        return sorted(self.stats.values(), key=lambda s: s.total_time, reverse=True)
+
+    def table(self):
+        """the recorded stats as a text table"""
+        lines = ["{:<30} {:>8} {:>12} {:>12} {:>12} {:>12} {:>14}".format(
+            "transformer", "calls", "total (s)", "mean (s)",
+            "events in", "events out", "allocated (B)")]
+        for stats in self.rows():
+            lines.append("{:<30} {:>8} {:>12.6f} {:>12.6f} {:>12} {:>12} {:>14}".format(
+                stats.name[:30], stats.calls, stats.total_time, stats.mean_time,
+                stats.events_in, stats.events_out, stats.allocated_bytes))
+        return "\n".join(lines)
+
+    def to_chrome_trace(self):
+        """the recorded calls in the Chrome trace-event format (as
+        read by chrome://tracing and Perfetto)
+        """
+        pid = os.getpid()
+        events = []
+        for (name, start, end, events_in, events_out, allocated_bytes, tid) in self.trace:
+            events.append({
+                "name": name,
+                "cat": "transformer",
+                "ph": "X",
+                "ts": (start - self._epoch) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": {
+                    "events_in": events_in,
+                    "events_out": events_out,
+                    "allocated_bytes": allocated_bytes
+                }
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, filename):
+        with open(filename, "w") as outf:
+            json.dump(self.to_chrome_trace(), outf)
+
+    def clear(self):
+        self.stats = {}
+        self.trace = []
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._previous = core.set_profiler(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        core.set_profiler(self._previous)
+        self._previous = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return False
+
+def _count(events):
+    try:
+        return len(events)
+    except TypeError:
+        # eg. a generator
+        return None
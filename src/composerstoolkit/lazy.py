@@ -0,0 +1,188 @@
+"""
+Lazy evaluation of chained transformations.
+
+    result = seq.lazy() |chain| transpose(2) |chain| invert() |chain| ...
+
+records each step rather than running it. The plan is only executed
+when the events of the result are first needed. At that point, runs of
+adjacent transformers that have registered a per-event kernel (see
+CTTransformer.fuse_with) are fused into a single pass over the events,
+and consecutive pitch-only affine steps (eg. repeated transpositions,
+a double inversion) are folded into one operation.
+"""
+from . import core
+from .columnar import ColumnarEvents
+from .core import CTEvent, CTSequence
+
+class PitchAffine():
+    """Per-event kernel mapping every pitch p to scale * p + offset.
+    If top_only, only the first (uppermost) pitch of each event is
+    kept.
+    """
+
+    def __init__(self, scale=1, offset=0, top_only=False):
+        self.scale = scale
+        self.offset = offset
+        self.top_only = top_only
+
+    def then(self, other):
+        """the kernel equivalent to applying self, then other"""
+        return PitchAffine(
+            other.scale * self.scale,
+            other.scale * self.offset + other.offset,
+            self.top_only or other.top_only)
+
+    def __call__(self, index, event):
+        pitches = event.pitches
+        if self.top_only:
+            pitches = [pitches[0]]
+        if self.scale == 1:
+            return CTEvent([p + self.offset for p in pitches], event.duration)
+        return CTEvent(
+            [self.scale * p + self.offset for p in pitches], event.duration)
+
+    def apply_columnar(self, events):
+        if self.top_only:
+            pitches = events.top_pitches()
+            offsets = range(len(events) + 1)
+        else:
+            pitches = events.pitch_array
+            offsets = events.offsets
+        if self.scale != 1:
+            pitches = self.scale * pitches
+        return ColumnarEvents(pitches + self.offset, offsets, events.duration_array)
+
+    def __repr__(self):
+        return "PitchAffine({}, {}, {})".format(
+            self.scale, self.offset, self.top_only)
+
+class EventMap():
+    """Per-event kernel wrapping a function f(index, event) that
+    returns the transformed event, or None to end the sequence there.
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, index, event):
+        return self.func(index, event)
+
+    def __repr__(self):
+        return "EventMap({})".format(self.func)
+
+class LazySequence(CTSequence):
+    """A CTSequence whose events are the result of a recorded plan of
+    transformations applied to a source sequence. Chaining onto it
+    returns a new LazySequence with a longer plan.
+    """
+
+    def __init__(self, source, plan=(), memento=None):
+        self._source = source
+        self._plan = tuple(plan)
+        super().__init__(None, memento)
+
+    @property
+    def events(self):
+        if self._events is None:
+            self._events = run_plan(self._source.events, self._plan)
+        return self._events
+
+    @events.setter
+    def events(self, events):
+        self._events = events
+
+    @property
+    def evaluated(self):
+        return self._events is not None
+
+    def chain(self, f):
+        if self.evaluated:
+            return LazySequence(self, (f,), self)
+        return LazySequence(self._source, self._plan + (f,), self)
+
+    def lazy(self):
+        return self
+
+    def stages(self):
+        """Describe how the plan will be executed, as a list of
+        stages, each being either a single transformation or a list
+        of transformations that will be fused into one pass
+        """
+        return [list(steps) if fused else steps
+            for (fused, steps) in _stages(self._plan)]
+
+def _fusable(f):
+    try:
+        return f.transformer.kernel is not None and "gate" not in f.kwargs
+    except AttributeError:
+        return False
+
+def _stages(plan):
+    """split the plan into runs of fusable steps and single steps"""
+    i = 0
+    while i < len(plan):
+        j = i
+        while j < len(plan) and _fusable(plan[j]):
+            j = j + 1
+        if j - i > 1:
+            yield (True, plan[i:j])
+            i = j
+        else:
+            yield (False, plan[i])
+            i = i + 1
+
+def _kernels(events, steps):
+    """build (and fold) the kernels for a run of fusable steps. This
+    needs the input events, as eg. invert() without an axis takes it
+    from the first event entering it.
+    """
+    kernels = []
+    for f in steps:
+        first = lambda kernels=tuple(kernels): _first_event(events, kernels)
+        kernel = f.transformer.kernel(first, *f.args, **f.kwargs)
+        if (kernels and isinstance(kernel, PitchAffine)
+                and isinstance(kernels[-1], PitchAffine)):
+            kernels[-1] = kernels[-1].then(kernel)
+        else:
+            kernels.append(kernel)
+    return kernels
+
+def _first_event(events, kernels):
+    event = events[0]
+    for kernel in kernels:
+        event = kernel(0, event)
+        if event is None:
+            raise IndexError("sequence is empty")
+    return event
+
+def run_plan(events, plan):
+    """Apply each transformation in plan to events in turn, fusing
+    where possible, and return the resulting events
+    """
+    for fused, steps in _stages(plan):
+        if fused:
+            profiler = core._profiler
+            if profiler is None:
+                events = _run_kernels(events, _kernels(events, steps))
+            else:
+                name = "fused({})".format(", ".join(
+                    [f.transformer._functor.__name__ for f in steps]))
+                events = profiler.measure(name,
+                    lambda seq: _run_kernels(seq.events, _kernels(seq.events, steps)),
+                    CTSequence(events))
+        else:
+            events = steps(CTSequence(events))
+    return events
+
+def _run_kernels(events, kernels):
+    if (len(kernels) == 1 and isinstance(kernels[0], PitchAffine)
+            and isinstance(events, ColumnarEvents)):
+        return kernels[0].apply_columnar(events)
+    result = []
+    for i, event in enumerate(events):
+        for kernel in kernels:
+            event = kernel(i, event)
+            if event is None:
+                return result
+        result.append(event)
+    return result
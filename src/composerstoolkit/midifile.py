@@ -0,0 +1,108 @@
+"""
+A minimal Standard MIDI File (format 1) writer, see
+Container.save_as_midi_file.
+
+Each track is written straight from a chronologically ordered stream
+of midievents: delta-times are encoded as they go by and running status
+is used for consecutive messages of the same type and channel, so no
+more than one event per track is held in memory.
+"""
+import struct
+
+TICKS_PER_BEAT = 960
+
+# for the file buffer used by Container.save_as_midi_file
+BUFFER_SIZE = 1 << 16
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+
+def write_midi_file(outf, tracks, bpm=120, dynamic=60,
+        ticks_per_beat=TICKS_PER_BEAT):
+    """Write a format 1 MIDI file to the binary file object outf.
+
+    tracks is a list of (channel, name, midievents) tuples, the
+    midievents being an iterable of midievents ordered by time (in
+    beats). A tempo track is written first. Pitches and the dynamic
+    may be floats, and are rounded to the nearest MIDI value.
+    """
+    outf.write(b"MThd")
+    outf.write(struct.pack(">LHHH", 6, 1, len(tracks) + 1, ticks_per_beat))
+    _write_track(outf, _tempo_track(bpm))
+    for channel, name, midievents in tracks:
+        _write_track(outf, _note_track(
+            channel, name, midievents, dynamic, ticks_per_beat))
+
+def _tempo_track(bpm):
+    microseconds_per_beat = int(round(60000000 / bpm))
+    yield b"\x00\xff\x51\x03" + microseconds_per_beat.to_bytes(3, "big")
+    yield _END_OF_TRACK
+
+def _note_track(channel, name, midievents, dynamic, ticks_per_beat):
+    if channel < 0 or channel > 15:
+        raise ValueError("channel must be between 0 and 15")
+    dynamic = _midi_value(dynamic, "dynamic {} is outside the MIDI range")
+    name = name.encode("latin-1")
+    yield b"\x00\xff\x03" + _vlq(len(name)) + name
+    tick = 0
+    status = None
+    for event in midievents:
+        if event.type == "NOTE_ON":
+            status_byte = NOTE_ON | channel
+            velocity = dynamic
+        elif event.type == "NOTE_OFF":
+            status_byte = NOTE_OFF | channel
+            velocity = 0
+        else:
+            continue
+        pitch = _midi_value(event.pitch, "pitch {} is outside the MIDI range")
+        message = (status_byte, pitch, velocity)
+        # ticks are rounded from the absolute time, so that rounding
+        # errors do not accumulate in the deltas
+        event_tick = int(round(event.time * ticks_per_beat))
+        if event_tick < tick:
+            raise ValueError("midievents are not in chronological order")
+        delta = _vlq(event_tick - tick)
+        tick = event_tick
+        if message[0] == status:
+            yield delta + bytes(message[1:])
+        else:
+            status = message[0]
+            yield delta + bytes(message)
+    yield _END_OF_TRACK
+
+_END_OF_TRACK = b"\x00\xff\x2f\x00"
+
+def _midi_value(value, message):
+    """value rounded to an int, which must be a 7 bit data byte"""
+    result = int(round(value))
+    if result < 0 or result > 127:
+        raise ValueError(message.format(value))
+    return result
+
+def _write_track(outf, chunks):
+    outf.write(b"MTrk")
+    if outf.seekable():
+        # stream the track, then go back and fill in its length
+        length_at = outf.tell()
+        outf.write(b"\x00\x00\x00\x00")
+        length = 0
+        for chunk in chunks:
+            length = length + outf.write(chunk)
+        end = outf.tell()
+        outf.seek(length_at)
+        outf.write(struct.pack(">L", length))
+        outf.seek(end)
+    else:
+        data = b"".join(chunks)
+        outf.write(struct.pack(">L", len(data)))
+        outf.write(data)
+
+def _vlq(value):
+    """encode value as a MIDI variable-length quantity"""
+    result = bytearray([value & 0x7f])
+    value = value >> 7
+    while value:
+        result.insert(0, (value & 0x7f) | 0x80)
+        value = value >> 7
+    return bytes(result)
@@ -0,0 +1,297 @@
+"""
+Real-time scheduling of midievents, see Container.playback and
+Container.playback_async
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+class PlaybackStats():
+    """Lateness (seconds after its deadline that each event was
+    dispatched) recorded during playback
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def record(self, lateness):
+        self.count = self.count + 1
+        self.total_lateness = self.total_lateness + lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+
+    @property
+    def mean_lateness(self):
+        if self.count == 0:
+            return 0.0
+        return self.total_lateness / self.count
+
+    def __str__(self):
+        return "<PlaybackStats events={} mean_lateness={:.6f}s max_lateness={:.6f}s>".format(
+            self.count, self.mean_lateness, self.max_lateness)
+
+class Scheduler():
+    """Dispatches (channel, midievent) pairs in real time.
+
+    Each event's deadline is fixed relative to the start of playback
+    (start + time * seconds_per_beat) on a monotonic clock, rather than
+    by sleeping for the gap since the previous event, so overruns do not
+    accumulate into drift. Events sharing a timestamp are dispatched
+    together after a single wait.
+
+    clock and sleep may be replaced, eg. for testing.
+    """
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+
+    def run(self, events, dispatch, seconds_per_beat=1.0):
+        """dispatch(channel, midievent) each of the chronologically
+        ordered (channel, midievent) pairs in events as it falls due.
+        Returns a PlaybackStats instance.
+        """
+        stats = PlaybackStats()
+        start = self.clock()
+        for beat, batch in itertools.groupby(events, key=lambda x: x[1].time):
+            deadline = start + beat * seconds_per_beat
+            delay = deadline - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            for channel, event in batch:
+                stats.record(self.clock() - deadline)
+                dispatch(channel, event)
+        return stats
+
+def seconds_per_beat(bpm):
+    return 60.0 / bpm
+
+class AsyncClock():
+    """The clock of the running asyncio event loop.
+
+    A clock for AsyncPlayback has now(), and a coroutine sleep(seconds,
+    interrupt=None) that waits for seconds (which may be math.inf), or
+    until interrupt (an asyncio future) is done, returning True if it
+    was interrupted.
+    """
+
+    def now(self):
+        return asyncio.get_running_loop().time()
+
+    async def sleep(self, seconds, interrupt=None):
+        if interrupt is None:
+            await asyncio.sleep(seconds)
+            return False
+        timeout = None if seconds == math.inf else seconds
+        try:
+            await asyncio.wait_for(asyncio.shield(interrupt), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+class VirtualClock():
+    """A clock for driving AsyncPlayback without really waiting: time
+    only moves on when advance() is awaited, waking each sleeper whose
+    deadline falls within the advance in order.
+
+    After waking a task, advance() waits for it to sleep on the clock
+    again (or to finish) before moving on, however long it takes to get
+    there, so a task woken by the clock should not go on to wait on
+    anything else.
+    """
+
+    def __init__(self, start=0.0):
+        self.time = start
+        self._sleepers = []
+        self._counter = itertools.count()
+        # tasks woken from sleep that have yet to sleep again or finish
+        self._woken = set()
+
+    def now(self):
+        return self.time
+
+    async def sleep(self, seconds, interrupt=None):
+        future = asyncio.get_running_loop().create_future()
+        task = asyncio.current_task()
+        self._woken.discard(task)
+        if seconds != math.inf:
+            heapq.heappush(self._sleepers,
+                (self.time + max(seconds, 0), next(self._counter), future, task))
+        wake = lambda interrupt: self._wake(future, task, True)
+        if interrupt is not None:
+            interrupt.add_done_callback(wake)
+        try:
+            return await future
+        finally:
+            if interrupt is not None:
+                interrupt.remove_done_callback(wake)
+
+    def _wake(self, future, task, interrupted):
+        if not future.done():
+            future.set_result(interrupted)
+            self._woken.add(task)
+
+    async def advance(self, seconds):
+        target = self.time + seconds
+        # let any tasks started since the last advance run up to their
+        # first sleep
+        await asyncio.sleep(0)
+        await self._settle()
+        while self._sleepers and self._sleepers[0][0] <= target:
+            deadline, _, future, task = heapq.heappop(self._sleepers)
+            if future.done():
+                # the sleep was interrupted or cancelled
+                continue
+            self.time = max(self.time, deadline)
+            self._wake(future, task, False)
+            await self._settle()
+        self.time = target
+        await self._settle()
+
+    async def _settle(self):
+        """wait until every woken task has slept again, or finished"""
+        while True:
+            self._woken = set(task for task in self._woken if not task.done())
+            if not self._woken:
+                return
+            await asyncio.sleep(0)
+
+class AsyncPlayback():
+    """Plays (channel, midievent) pairs from a Container without
+    blocking the event loop, so that several containers, or generation
+    and playback, can share one loop:
+
+        playback = container.playback_async(synth).start()
+        ...
+        playback.pause()
+        playback.seek(8)
+        playback.resume()
+        stats = await playback
+
+    Awaiting the playback starts it if need be, and returns a
+    PlaybackStats instance once the events run out or stop() is called.
+    Positions are in the time units of Container.iter_playback_events.
+    Pausing, seeking and stopping silence any notes still sounding.
+    """
+
+    def __init__(self, container, player_func, dynamic=60, clock=None):
+        self.container = container
+        self.player_func = player_func
+        self.dynamic = dynamic
+        self.clock = clock if clock is not None else AsyncClock()
+        self.seconds_per_beat = seconds_per_beat(container.options["bpm"])
+        self.stats = PlaybackStats()
+        self._position = 0.0
+        self._paused = False
+        self._stopped = False
+        self._seek_to = None
+        self._sounding = set()
+        self._start = None
+        # done once a control is used, interrupting any wait
+        self._changed = None
+        self._task = None
+
+    @property
+    def position(self):
+        if self._start is None or self._paused or self._stopped:
+            return self._position
+        return (self.clock.now() - self._start) / self.seconds_per_beat
+
+    @property
+    def paused(self):
+        return self._paused
+
+    @property
+    def done(self):
+        return self._task is not None and self._task.done()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+        return self
+
+    def __await__(self):
+        return self.start()._task.__await__()
+
+    def pause(self):
+        if not self._paused:
+            self._position = self.position
+            self._paused = True
+            self._notify()
+
+    def resume(self):
+        if self._paused:
+            self._paused = False
+            self._notify()
+
+    def seek(self, position):
+        if position < 0:
+            raise ValueError("position cannot be less than 0")
+        self._seek_to = position
+        self._notify()
+
+    def stop(self):
+        self._position = self.position
+        self._stopped = True
+        self._notify()
+
+    def _notify(self):
+        if self._changed is not None and not self._changed.done():
+            self._changed.set_result(None)
+
+    async def run(self):
+        self._seek_to = self._position if self._seek_to is None else self._seek_to
+        batches = None
+        batch = None
+        while not self._stopped:
+            self._changed = asyncio.get_running_loop().create_future()
+            if self._seek_to is not None:
+                self._all_notes_off()
+                self._position = self._seek_to
+                self._seek_to = None
+                batches = self._batches_from(self._position)
+                batch = next(batches, None)
+                self._start = self.clock.now() - self._position * self.seconds_per_beat
+            if self._paused:
+                self._all_notes_off()
+                await self.clock.sleep(math.inf, self._changed)
+                self._start = self.clock.now() - self._position * self.seconds_per_beat
+                continue
+            if batch is None:
+                break
+            beat, events = batch
+            deadline = self._start + beat * self.seconds_per_beat
+            delay = deadline - self.clock.now()
+            if delay > 0 and await self.clock.sleep(delay, self._changed):
+                continue
+            for channel_no, event in events:
+                self.stats.record(self.clock.now() - deadline)
+                self._dispatch(channel_no, event)
+            self._position = beat
+            batch = next(batches, None)
+        self._all_notes_off()
+        return self.stats
+
+    def _batches_from(self, position):
+        events = itertools.dropwhile(
+            lambda x: x[1].time < position,
+            self.container.iter_channel_events())
+        return ((beat, list(batch)) for (beat, batch)
+            in itertools.groupby(events, key=lambda x: x[1].time))
+
+    def _dispatch(self, channel_no, event):
+        if event.type == "NOTE_ON":
+            self._sounding.add((channel_no, event.pitch))
+            self.player_func.noteon(channel_no, event.pitch, self.dynamic)
+        elif event.type == "NOTE_OFF" and (channel_no, event.pitch) in self._sounding:
+            # (after seeking, skips the ends of notes that were never started)
+            self._sounding.discard((channel_no, event.pitch))
+            self.player_func.noteoff(channel_no, event.pitch)
+
+    def _all_notes_off(self):
+        for channel_no, pitch in sorted(self._sounding):
+            self.player_func.noteoff(channel_no, pitch)
+        self._sounding.clear()
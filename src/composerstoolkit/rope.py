@@ -0,0 +1,211 @@
+"""
+Persistent concatenation of event sequences.
+
+An EventRope is a balanced (AVL) binary tree whose leaves hold runs of
+events. Concatenating two ropes, or repeating one n times, builds a
+handful of new nodes that share the existing ones, rather than copying
+every event, so CTSequence.__add__ and loop() cost O(log n) however
+long the sequences grow. Events are only laid out in a flat list when
+a slice or materialize() asks for one.
+
+The nodes are never changed, so ropes share them freely. A rope can
+still be changed like a list (append, index assignment and so on): the
+first change copies its events out into a list of its own (see
+core.CopyOnWriteStore). A list concatenated onto a rope may also change
+later, so its events are copied (by reference) into a tuple once.
+"""
+import itertools
+
+from .core import CopyOnWriteStore, EventStore
+
+# leaves that would hold fewer events than this are merged on
+# concatenation, so that appending short cells one at a time does not
+# leave one node per cell
+LEAF_SIZE = 32
+
+class _Leaf():
+    __slots__ = ["items", "length"]
+    height = 0
+
+    def __init__(self, items):
+        # either a tuple, or an EventStore no one will change (eg.
+        # ColumnarEvents, or a snapshot of another store)
+        self.items = items
+        self.length = len(items)
+
+class _Concat():
+    __slots__ = ["left", "right", "length", "height"]
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.length = left.length + right.length
+        self.height = max(left.height, right.height) + 1
+
+_EMPTY = _Leaf(())
+
+class EventRope(CopyOnWriteStore):
+    """A persistent sequence of CTEvents supporting O(log n)
+    concatenation (concat, +) and repetition (repeat), and O(log n)
+    indexing. Slicing returns a list.
+    """
+
+    def __init__(self, node=_EMPTY):
+        self._node = node
+
+    @classmethod
+    def from_events(cls, events):
+        if isinstance(events, EventRope):
+            return events.snapshot()
+        return cls(_leaf(events))
+
+    @classmethod
+    def concat(cls, left, right):
+        """the events of left followed by those of right (either may be
+        an EventRope, another EventStore or a list of events)
+        """
+        return cls(_join(
+            cls.from_events(left)._node,
+            cls.from_events(right)._node))
+
+    def repeat(self, n_times):
+        """the events of this rope, n_times over. The copies share
+        one another's nodes, so this takes O(log n_times) nodes.
+        """
+        if n_times < 0:
+            raise ValueError("n_times cannot be less than 0")
+        self._freeze()
+        result = _EMPTY
+        power = self._node
+        while n_times:
+            if n_times & 1:
+                result = _join(result, power)
+            n_times = n_times >> 1
+            if n_times:
+                power = _join(power, power)
+        return EventRope(result)
+
+    @property
+    def depth(self):
+        self._freeze()
+        return self._node.height
+
+    def _shared_copy(self):
+        return EventRope(self._node)
+
+    def _share_events(self, events):
+        self._node = _leaf(events)
+
+    def _shared_len(self):
+        return self._node.length
+
+    def _shared_getitem(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            return list(self._iter_range(start, stop))
+        n = len(self)
+        if index < 0:
+            index = index + n
+        if index < 0 or index >= n:
+            raise IndexError("event index out of range")
+        node = self._node
+        while isinstance(node, _Concat):
+            if index < node.left.length:
+                node = node.left
+            else:
+                index = index - node.left.length
+                node = node.right
+        return node.items[index]
+
+    def _shared_iter(self):
+        return self._iter_range(0, self._node.length)
+
+    def _iter_range(self, start, stop):
+        """yield the events from start to stop, visiting only the
+        leaves that hold them
+        """
+        stack = [(self._node, 0)]
+        while stack:
+            node, offset = stack.pop()
+            if offset >= stop or offset + node.length <= start:
+                continue
+            if isinstance(node, _Concat):
+                stack.append((node.right, offset + node.left.length))
+                stack.append((node.left, offset))
+            else:
+                yield from itertools.islice(
+                    node.items, max(start - offset, 0), stop - offset)
+
+    def __add__(self, other):
+        if not isinstance(other, (list, tuple, EventStore)):
+            return NotImplemented
+        return EventRope.concat(self, other)
+
+    def __radd__(self, other):
+        if not isinstance(other, (list, tuple, EventStore)):
+            return NotImplemented
+        return EventRope.concat(other, self)
+
+    __hash__ = None
+
+def _leaf(events):
+    if isinstance(events, CopyOnWriteStore):
+        return _Leaf(events.snapshot())
+    if isinstance(events, (tuple, EventStore)):
+        # already read-only
+        return _Leaf(events)
+    return _Leaf(tuple(events))
+
+def _join(left, right):
+    """join two balanced trees into one balanced tree"""
+    if left.length == 0:
+        return right
+    if right.length == 0:
+        return left
+    if left.height > right.height + 1:
+        return _join_right(left, right)
+    if right.height > left.height + 1:
+        return _join_left(left, right)
+    return _node(left, right)
+
+def _node(left, right):
+    if (isinstance(left, _Leaf) and isinstance(right, _Leaf)
+            and left.length + right.length <= LEAF_SIZE):
+        return _Leaf(tuple(left.items) + tuple(right.items))
+    return _Concat(left, right)
+
+def _join_right(left, right):
+    # left is the taller tree: descend its right spine
+    a, c = left.left, left.right
+    if c.height <= right.height + 1:
+        joined = _node(c, right)
+    else:
+        joined = _join_right(c, right)
+    if joined.height <= a.height + 1:
+        return _Concat(a, joined)
+    if joined.left.height > joined.right.height:
+        joined = _rotate_right(joined)
+    return _rotate_left(_Concat(a, joined))
+
+def _join_left(left, right):
+    # right is the taller tree: descend its left spine
+    c, b = right.left, right.right
+    if c.height <= left.height + 1:
+        joined = _node(left, c)
+    else:
+        joined = _join_left(left, c)
+    if joined.height <= b.height + 1:
+        return _Concat(joined, b)
+    if joined.right.height > joined.left.height:
+        joined = _rotate_left(joined)
+    return _rotate_right(_Concat(joined, b))
+
+def _rotate_left(node):
+    right = node.right
+    return _Concat(_Concat(node.left, right.left), right.right)
+
+def _rotate_right(node):
+    left = node.left
+    return _Concat(left.left, _Concat(left.right, node.right))
@@ -0,0 +1,106 @@
+"""
+Streaming (iterator-backed) sequences, for generating and rendering
+material of unbounded length in constant memory, eg:
+
+    stream = CTStream.concat(random_walk(base_seq, mutators)) \\
+        |chain| stream_transpose(12) \\
+        |chain| stream_map_to_pulses(CTStream(steady_pulse(1, 4).events) |chain| stream_loop())
+
+The stream_* transformers consume and produce events one at a time.
+A stream can only be read once.
+"""
+import itertools
+
+from .core import CTEvent, CTSequence, CTTransformer, iter_midi_events
+
+class CTStream():
+    """A sequence whose events are drawn lazily from an iterable,
+    which may be infinite
+    """
+
+    def __init__(self, events, memento=None):
+        self.events = iter(events)
+        self.memento = memento
+
+    @classmethod
+    def concat(cls, sequences):
+        """a stream of the events of each sequence in turn (for example,
+        the single-event sequences yielded by solvers.random_walk)
+        """
+        return cls(itertools.chain.from_iterable(
+            seq.events for seq in sequences))
+
+    def __iter__(self):
+        return self.events
+
+    def chain(self, f):
+        return CTStream(f(self), self)
+
+    def take(self, n):
+        """consume the next n events into a CTSequence"""
+        return CTSequence(list(itertools.islice(self.events, n)))
+
+    def to_midi_events(self, time_offset=0):
+        return iter_midi_events(self.events, time_offset)
+
+    def __str__(self):
+        return "<CTStream {}>".format(self.events)
+
+@CTTransformer
+def stream_loop(seq, n_times=None):
+    """Repeat the stream n_times, or forever if n_times is None.
+    The first pass is buffered as it goes by, so memory grows with the
+    length of one pass (use on finite cells only).
+    """
+    if n_times is not None and n_times < 0:
+        raise ValueError("n_times cannot be less than 0")
+    return _loop(seq.events, n_times)
+
+def _loop(events, n_times):
+    if n_times == 0:
+        return
+    buffer = []
+    for e in events:
+        buffer.append(e)
+        yield e
+    i = 1
+    while buffer and (n_times is None or i < n_times):
+        yield from buffer
+        i = i + 1
+
+@CTTransformer
+def stream_transpose(seq, interval):
+    return (CTEvent([p + interval for p in e.pitches], e.duration)
+        for e in seq.events)
+
+@CTTransformer
+def stream_retrograde(seq, window=16):
+    """reverse each consecutive window of events"""
+    if window < 1:
+        raise ValueError("window must be at least 1")
+    return _retrograde(seq.events, window)
+
+def _retrograde(events, window):
+    while True:
+        buffer = list(itertools.islice(events, window))
+        if not buffer:
+            return
+        buffer.reverse()
+        yield from buffer
+
+@CTTransformer
+def stream_map_to_pulses(seq, pulse_sequence):
+    return (CTEvent(e.pitches, pulse.duration)
+        for (e, pulse) in zip(seq.events, pulse_sequence.events))
+
+@CTTransformer
+def stream_map_to_pitches(seq, pitch_sequence):
+    return _map_to_pitches(seq.events, iter(pitch_sequence.events))
+
+def _map_to_pitches(events, pitch_events):
+    for e in events:
+        try:
+            next_pitch = next(pitch_events)
+            yield CTEvent(next_pitch.pitches[0], e.duration)
+        except StopIteration:
+            yield CTEvent(None, e.duration)
@@ -0,0 +1,105 @@
+"""
+Zero-copy views onto the events of a sequence, as returned by
+retrograde(), rotate() and CTSequence slicing.
+
+Rather than copying events into a new list, a view records how to find
+each event in its parent: a range of indices (which may run backwards
+or be strided), rotated by a modular shift. Views of views compose into
+a single view where possible. A view can be changed like a list: the
+first change copies its events out into a list of its own (see
+core.CopyOnWriteStore), leaving the parent as it was.
+
+Views, EventRopes, ColumnarEvents and tuples are shared (views and
+ropes through a snapshot, so that later changes to them do not show
+through). A list may also be changed in place, so a view of one reads
+from a tuple copied from it when the view is made. This is the one copy
+a view makes: of references to the events, not of the events.
+"""
+import itertools
+
+from .core import CopyOnWriteStore
+
+class EventView(CopyOnWriteStore):
+    """The events base[indices[(i + shift) % len(indices)]], for i in
+    range(len(indices))
+    """
+
+    shares_slices = True
+
+    def __init__(self, base, indices=None, shift=0):
+        if isinstance(base, list):
+            base = tuple(base)
+        elif isinstance(base, CopyOnWriteStore):
+            base = base.snapshot()
+        if indices is None:
+            indices = range(len(base))
+        self.base = base
+        self.indices = indices
+        self.shift = shift % len(indices) if len(indices) else 0
+
+    @classmethod
+    def of(cls, events):
+        """a view of all of events"""
+        if isinstance(events, EventView):
+            return events
+        return cls(events)
+
+    def reversed(self):
+        self._freeze()
+        n = len(self.indices)
+        return EventView(self.base, self.indices[::-1], -self.shift if n else 0)
+
+    def rotated(self, n_times):
+        """the view moved n_times to the left, with the events moved
+        off the front appended to the back
+        """
+        self._freeze()
+        return EventView(self.base, self.indices, self.shift + n_times)
+
+    def _positions(self):
+        """the index into base of each event, in order"""
+        if self.shift == 0:
+            return self.indices
+        return itertools.chain(
+            self.indices[self.shift:], self.indices[:self.shift])
+
+    def _shared_copy(self):
+        return EventView(self.base, self.indices, self.shift)
+
+    def _share_events(self, events):
+        self.base = events
+        self.indices = range(len(events))
+        self.shift = 0
+
+    def _shared_len(self):
+        return len(self.indices)
+
+    def _shared_getitem(self, index):
+        if isinstance(index, slice):
+            if self.shift == 0:
+                return EventView(self.base, self.indices[index])
+            # the slice may wrap around the rotation, so view this view
+            return EventView(self, range(len(self))[index])
+        n = len(self.indices)
+        if index < 0:
+            index = index + n
+        if index < 0 or index >= n:
+            raise IndexError("event index out of range")
+        return self.base[self.indices[(index + self.shift) % n]]
+
+    def _shared_iter(self):
+        base = self.base
+        if isinstance(base, (list, tuple)):
+            return map(base.__getitem__, self._positions())
+        if self.shift == 0 and self.indices == range(len(base)):
+            return iter(base)
+        return (base[i] for i in self._positions())
+
+def view(events):
+    """events itself, if slicing it already shares its storage (eg.
+    ColumnarEvents) or it is a list (whose slices are copied, as a
+    view of it would be), otherwise an EventView of it
+    """
+    if getattr(events, "shares_slices", False) or isinstance(events, list):
+        return events
+    return EventView(events)
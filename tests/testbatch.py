@@ -0,0 +1,85 @@
+import functools
+import os
+import tempfile
+import threading
+import unittest
+
+import mido
+
+from composerstoolkit import (CTEvent, CTSequence, Container,
+render_midi_files)
+
+def make_container(pitch):
+    container = Container(bpm=100)
+    container.add_sequence(0, CTSequence([CTEvent(pitch, 1)]))
+    return container
+
+def broken_factory():
+    raise RuntimeError("no container today")
+
+class RenderMidiFilesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_containers_and_factories(self):
+        jobs = [(self.path("{}.mid".format(i)), functools.partial(make_container, 60 + i))
+            for i in range(10)]
+        jobs.append((self.path("direct.mid"), make_container(72)))
+        results = render_midi_files(jobs, processes=2, chunksize=3)
+        assert sorted(r.filename for r in results) == sorted(j[0] for j in jobs)
+        assert all(r.error is None for r in results)
+        midi = mido.MidiFile(self.path("3.mid"))
+        assert [m.note for m in midi.tracks[1] if m.type == "note_on"] == [63]
+
+    def test_failures_do_not_stop_the_batch(self):
+        unpicklable = lambda: make_container(60)
+        jobs = [
+            (self.path("a.mid"), functools.partial(make_container, 60)),
+            (self.path("b.mid"), broken_factory),
+            (self.path("c.mid"), unpicklable),
+            (self.path("d.mid"), "not a container"),
+            (self.path("e.mid"), functools.partial(make_container, 200)),
+            (self.path("f.mid"), functools.partial(make_container, 62)),
+        ]
+        progress = []
+        results = render_midi_files(jobs, processes=2,
+            progress=lambda r, done, total: progress.append((done, total)))
+        errors = {os.path.basename(r.filename): r.error for r in results}
+        assert errors["a.mid"] is None
+        assert errors["f.mid"] is None
+        assert errors["b.mid"] == "RuntimeError: no container today"
+        assert errors["c.mid"] is not None
+        assert errors["d.mid"].startswith("TypeError")
+        assert errors["e.mid"].startswith("ValueError")
+        assert progress == [(i, 6) for i in range(1, 7)]
+
+    def test_in_process(self):
+        jobs = (("{}.mid".format(i), make_container(60)) for i in range(3))
+        jobs = ((self.path(f), c) for (f, c) in jobs)
+        progress = []
+        results = render_midi_files(jobs, processes=1,
+            progress=lambda r, done, total: progress.append((done, total)))
+        assert len(results) == 3
+        assert progress == [(1, None), (2, None), (3, None)]
+
+    def test_progress_on_calling_thread(self):
+        unpicklable = lambda: make_container(60)
+        jobs = []
+        for i in range(40):
+            source = unpicklable if i % 3 else functools.partial(make_container, 60)
+            jobs.append((self.path("{}.mid".format(i)), source))
+        progress = []
+        def report(result, done, total):
+            progress.append((threading.current_thread() is threading.main_thread(),
+                done, total))
+        results = render_midi_files(jobs, processes=2, chunksize=2, progress=report)
+        assert len(results) == 40
+        assert len([r for r in results if r.error is not None]) == 26
+        assert progress == [(True, i, 40) for i in range(1, 41)]
@@ -0,0 +1,31 @@
+import unittest
+
+import benchmarks
+
+class BenchmarkRunnerTests(unittest.TestCase):
+
+    def test_run(self):
+        results = benchmarks.run(
+            ["transformers.transpose", "boolean_gate"],
+            tier="small", repeat=2, min_time=0)
+        assert sorted(results["results"].keys()) == [
+            "boolean_gate", "transformers.transpose"]
+        timings = results["results"]["transformers.transpose"]
+        assert sorted(timings.keys(), key=int) == ["1000", "2000"]
+        assert timings["1000"]["min"] > 0
+
+    def test_every_benchmark_sets_up(self):
+        for name, (base_size, setup) in benchmarks.BENCHMARKS.items():
+            assert callable(setup(base_size)), name
+
+    def test_compare(self):
+        baseline = {"results": {
+            "a": {"10": {"min": 1.0}, "20": {"min": 2.0}},
+            "b": {"10": {"min": 1.0}}}}
+        results = {"results": {
+            "a": {"10": {"min": 1.1}, "20": {"min": 3.0}},
+            "c": {"10": {"min": 1.0}}}}
+        rows = benchmarks.compare(results, baseline, tolerance=0.25)
+        assert [(name, size, regressed) for (name, size, _, _, _, regressed) in rows] == [
+            ("a", 10, False),
+            ("a", 20, True)]
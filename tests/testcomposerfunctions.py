@@ -1,10 +1,19 @@
+import random
 import unittest
 
+import numpy as np
+
 from composerstoolkit import (CTEvent, CTSequence, CTGenerator, 
 CTTransformer, random_walk, random_walk_backtracking,
 random_walk_backtracking_w_heuristics, Evolutionary, Extinction,
 transpose, constraint_in_set, heuristic_trend_upwards, heuristic_sine_shape,
-scales)
+scales, constraint_no_leaps_more_than, UnsatisfiableException, DeadPathIndex,
+constraint_note_is, constraint_no_repeated_adjacent_notes, SolverState,
+random_walk_bitset)
+from composerstoolkit.composers.constraints import incremental, pitch_mask
+from composerstoolkit.composers.solvers import _random_bit
+from composerstoolkit.composers.parallel import solve_first, solve_distinct
+from composerstoolkit.composers.heuristics import heuristic_single_pitch, PITCHES
 
 class SolversTests(unittest.TestCase):
     
@@ -126,3 +135,362 @@ class SolversTests(unittest.TestCase):
         with self.assertRaises(Extinction) as context:
             seq,transformations = evo()
         
+
+class DeadPathIndexTests(unittest.TestCase):
+    
+    def test_cursor(self):
+        index = DeadPathIndex()
+        for note in [60, 62, 64]:
+            index.push(note)
+        index.add_current()
+        index.pop()
+        assert index.is_dead(64)
+        assert not index.is_dead(65)
+        index.pop()
+        assert not index.is_dead(64)
+        index.push(63)
+        assert not index.is_dead(64)
+        assert len(index) == 1
+        assert index.nbytes > 0
+        
+    def test_duplicates_are_ignored(self):
+        index = DeadPathIndex()
+        index.push(60)
+        index.add_current()
+        index.add_current()
+        assert len(index) == 1
+        
+    def test_max_entries(self):
+        index = DeadPathIndex(max_entries=2)
+        index.push(60)
+        for note in [61, 62, 63]:
+            index.push(note)
+            index.add_current()
+            index.pop()
+        assert len(index) == 2
+        assert index.evicted == 1
+        assert not index.is_dead(61)
+        assert index.is_dead(62)
+        assert index.is_dead(63)
+        # the evicted branch is pruned
+        assert list(index._root.children[60].children.keys()) == [62, 63]
+        
+    def test_solver_stats(self):
+        # three steps of at most a tone cannot reach 72
+        def reach_72(context):
+            note, seq, tick = context
+            return tick != 3 or note == 72
+        stats = {}
+        with self.assertRaises(UnsatisfiableException):
+            random_walk_backtracking(60, 8, [
+                constraint_in_set(scales.C_major),
+                constraint_no_leaps_more_than(2),
+                reach_72], stats=stats)
+        assert stats["dead_paths"] > 0
+        assert stats["dead_paths_nbytes"] > 0
+        
+    def test_solver_max_dead_paths(self):
+        stats = {}
+        seq = random_walk_backtracking(60, 8,
+            [constraint_in_set(scales.C_major)], max_dead_paths=4, stats=stats)
+        assert len(seq.events) == 8
+        assert stats["dead_paths_evicted"] <= stats["dead_paths"]
+
+class ConstraintDomainTests(unittest.TestCase):
+
+    def test_in_set_domain(self):
+        constraint = constraint_in_set([60, 62, 64])
+        assert constraint.domain(1, [60]) == {60, 62, 64}
+        assert constraint.domain(0, [61]) == set()
+
+    def test_in_set_range(self):
+        solvers = [
+            random_walk_backtracking,
+            lambda *args: random_walk_backtracking(*args, backjumping=True),
+            random_walk_bitset]
+        for solver in solvers:
+            seq = solver(60, 8, [constraint_in_set()])
+            assert len(seq.events) == 8
+            seq = solver(60, 8, [constraint_in_set(range(50, 70))])
+            assert all(50 <= e.pitches[0] < 70 for e in seq.events)
+            with self.assertRaises(UnsatisfiableException):
+                solver(60, 8, [constraint_in_set(range(70, 80))])
+
+    def test_no_leaps_domain(self):
+        constraint = constraint_no_leaps_more_than(2)
+        assert list(constraint.domain(1, [60])) == [58, 59, 60, 61, 62]
+
+    def test_note_is_domain(self):
+        constraint = constraint_note_is(tick=3, pitch=67)
+        assert constraint.domain(3, [60]) == {67}
+        assert constraint.domain(2, [60]) is None
+        assert constraint((67, None, 3))
+        assert not constraint((66, None, 3))
+
+    def test_no_repeated_adjacent_notes(self):
+        constraint = constraint_no_repeated_adjacent_notes()
+        assert 60 not in constraint.domain(1, [60])
+        assert 62 in constraint.domain(1, [60])
+        # the same domain each time the same note comes up
+        assert constraint.domain(1, [60]) is constraint.domain(3, [62, 64, 60])
+        assert constraint((62, CTSequence([CTEvent(60, 1), CTEvent(62, 1)]), 1))
+        assert not constraint((60, CTSequence([CTEvent(60, 1), CTEvent(60, 1)]), 1))
+        seq = random_walk_backtracking(60, 10, [constraint])
+        pitches = [e.pitches[0] for e in seq.events]
+        assert all(a != b for (a, b) in zip(pitches, pitches[1:]))
+
+    def test_solver_uses_domains(self):
+        calls = []
+        def opaque(context):
+            calls.append(context)
+            return True
+        seq = random_walk_backtracking(60, 8, [
+            constraint_in_set(scales.C_major),
+            constraint_no_leaps_more_than(3),
+            constraint_note_is(tick=4, pitch=67),
+            opaque])
+        pitches = [e.pitches[0] for e in seq.events]
+        assert len(pitches) == 8
+        assert set(pitches).issubset(scales.C_major)
+        assert all(abs(a - b) <= 3 for (a, b) in zip(pitches, pitches[1:]))
+        assert pitches[5] == 67
+        # only the notes that survive the domains reach the opaque constraint
+        assert all(note in scales.C_major for (note, _, _) in calls)
+        assert [tick for (_, _, tick) in calls if tick == 4] \
+            and all(note == 67 for (note, _, tick) in calls if tick == 4)
+
+    def test_backtracking_to_the_first_note(self):
+        # most first notes (59 to 61) cannot reach 62 by the next, so
+        # the solver must often back up to the first note and try again
+        for seed in range(40):
+            seq = random_walk_backtracking(60, 3, [
+                constraint_no_leaps_more_than(1),
+                constraint_note_is(tick=1, pitch=62)],
+                rng=random.Random(seed))
+            assert [e.pitches[0] for e in seq.events] == [60, 61, 62]
+
+class IncrementalConstraintTests(unittest.TestCase):
+
+    def test_solver_state(self):
+        state = SolverState(60, voices=[[72, 74, 76]])
+        state.push(62)
+        state.push(60)
+        assert state.tick == 2
+        assert state.last_pitch == 60
+        assert state.pitch_counts[60] == 2
+        assert state.aligned() == [76]
+        assert state.pop() == 60
+        assert state.pitch_counts[60] == 1
+        state.pop()
+        assert set(state.pitch_set) == {60}
+
+    def test_legacy_constraint_adapter(self):
+        contexts = []
+        def legacy(context):
+            contexts.append(context)
+            return True
+        state = SolverState(60)
+        state.push(62)
+        assert incremental(legacy)(64, state)
+        note, seq, tick = contexts[0]
+        assert (note, tick) == (64, 1)
+        assert [e.pitches[0] for e in seq.events] == [60, 62, 64]
+
+    def test_domain_adapter(self):
+        check = incremental(constraint_no_leaps_more_than(2))
+        state = SolverState(60)
+        assert check(62, state)
+        assert not check(63, state)
+
+    def test_incremental_constraint(self):
+        def at_most_twice(context):
+            raise AssertionError("should not be called")
+        at_most_twice.incremental = lambda note, state: state.pitch_counts[note] < 2
+        seq = random_walk_backtracking(60, 12, [
+            constraint_in_set(scales.C_major),
+            constraint_no_leaps_more_than(4),
+            at_most_twice])
+        pitches = [e.pitches[0] for e in seq.events]
+        assert len(pitches) == 12
+        assert all(pitches.count(p) <= 2 for p in pitches)
+
+    def test_aligned_voices(self):
+        voice1 = CTSequence([CTEvent(p, 1) for p in [72, 70, 68, 66, 64, 62]])
+        below = lambda context: True
+        below.incremental = lambda note, state: note < state.aligned()[0] - 2
+        seq = random_walk_backtracking(60, 6, [below], voices=[voice1])
+        pitches = [e.pitches[0] for e in seq.events]
+        assert all(p < v - 2 for (p, v) in zip(pitches[1:], [72, 70, 68, 66, 64]))
+
+    def test_long_solve(self):
+        seq = random_walk_backtracking(60, 2000, [
+            constraint_in_set(scales.C_major),
+            constraint_no_leaps_more_than(3)])
+        assert len(seq.events) == 2000
+
+class HeuristicArrayTests(unittest.TestCase):
+
+    def test_array_matches_weights(self):
+        choices = [50, 55, 60, 61, 70, 90]
+        for heuristic in [heuristic_sine_shape(60, 20, 16, 2),
+                heuristic_trend_upwards(60, 3), heuristic_single_pitch(64)]:
+            for tick in range(20):
+                weights = heuristic(tick, choices, [1.0] * len(choices))
+                array = heuristic.array(tick, np.ones(len(PITCHES)))
+                assert weights == [array[note] for note in choices]
+
+    def test_sine_rows_are_kept(self):
+        heuristic = heuristic_sine_shape()
+        weights = np.ones(len(PITCHES))
+        assert heuristic.array(3, weights) is not heuristic.array(3, weights)
+        assert (heuristic.array(3, weights) == heuristic.array(3, weights)).all()
+        assert heuristic.array(3, weights).argmax() != heuristic.array(11, weights).argmax()
+
+    def test_mixed_heuristics(self):
+        only_even = lambda tick, choices, weights: [
+            w if note % 2 == 0 else 0 for (w, note) in zip(weights, choices)]
+        seq = random_walk_backtracking_w_heuristics(60, 16,
+            [constraint_no_leaps_more_than(4)],
+            [heuristic_trend_upwards(60), only_even])
+        assert all(e.pitches[0] % 2 == 0 for e in seq.events)
+
+class MultiStartTests(unittest.TestCase):
+
+    def setUp(self):
+        self.kwargs = dict(starting_pitch=60, n_events=12, constraints=[
+            constraint_in_set(scales.C_major),
+            constraint_no_leaps_more_than(2)])
+
+    def test_solver_rng(self):
+        seqs = [random_walk_backtracking(rng=random.Random(7), **self.kwargs)
+            for i in range(2)]
+        assert seqs[0] == seqs[1]
+
+    def test_first_solution(self):
+        seq = solve_first(random_walk_backtracking, processes=2, **self.kwargs)
+        assert len(seq.events) == 12
+
+    def test_distinct_solutions(self):
+        seqs = solve_distinct(random_walk_backtracking, 3, processes=2,
+            **self.kwargs)
+        assert len(seqs) == 3
+        assert len(set(seqs)) == 3
+
+    def test_seeded_in_process(self):
+        runs = [solve_distinct(random_walk_backtracking, 2, processes=1,
+            seed=1, **self.kwargs) for i in range(2)]
+        assert runs[0] == runs[1]
+
+    def test_unsatisfiable(self):
+        kwargs = dict(starting_pitch=60, n_events=4,
+            constraints=[constraint_in_set([61])])
+        with self.assertRaises(UnsatisfiableException):
+            solve_first(random_walk_backtracking, max_starts=4, processes=2,
+                **kwargs)
+        with self.assertRaises(UnsatisfiableException):
+            solve_distinct(random_walk_backtracking, 2, processes=1,
+                starting_pitch=60, n_events=2, constraints=[constraint_in_set([60])])
+
+class BackjumpingTests(unittest.TestCase):
+
+    def test_constraints_hold(self):
+        stats = {}
+        seq = random_walk_backtracking(60, 32, [
+            constraint_in_set(scales.C_major),
+            constraint_no_leaps_more_than(2),
+            constraint_note_is(tick=20, pitch=79)],
+            stats=stats, backjumping=True)
+        pitches = [e.pitches[0] for e in seq.events]
+        assert len(pitches) == 32
+        assert set(pitches).issubset(scales.C_major)
+        assert all(abs(a - b) <= 2 for (a, b) in zip(pitches, pitches[1:]))
+        assert pitches[21] == 79
+        assert stats["max_depth"] == 31
+        assert stats["nodes"] >= 31
+
+    def test_jumps_to_culprit(self):
+        # at tick 12, the note must be a semitone above the note at tick 1
+        def echo(context):
+            raise AssertionError("should not be called")
+        echo.incremental = lambda note, state: (
+            state.tick != 12 or note == state.pitches[2] + 1)
+        echo.lookback = lambda tick: [1] if tick == 12 else []
+        for seed in range(5):
+            stats = {}
+            seq = random_walk_backtracking(60, 14, [
+                constraint_in_set(scales.C_major),
+                constraint_no_leaps_more_than(12), echo],
+                stats=stats, backjumping=True, rng=random.Random(seed))
+            pitches = [e.pitches[0] for e in seq.events]
+            assert pitches[13] == pitches[2] + 1
+            assert stats["nogoods"] == stats["backtracks"]
+            assert stats["backtracks"] < 100
+
+    def test_heuristics_solver(self):
+        seq = random_walk_backtracking_w_heuristics(60, 16,
+            [constraint_in_set(scales.C_major)],
+            [heuristic_trend_upwards(60)], backjumping=True)
+        assert len(seq.events) == 16
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(UnsatisfiableException):
+            random_walk_backtracking(60, 8, [
+                constraint_no_leaps_more_than(1),
+                constraint_note_is(tick=3, pitch=70)], backjumping=True)
+
+    def test_chronological_stats(self):
+        stats = {}
+        random_walk_backtracking(60, 8, [constraint_in_set(scales.C_major)],
+            stats=stats)
+        assert stats["max_depth"] == 7
+        assert stats["nodes"] >= 7
+        assert stats["backtracks"] >= 0
+
+class BitsetSolverTests(unittest.TestCase):
+
+    def test_pitch_mask(self):
+        assert pitch_mask([0, 2, 3]) == 0b1101
+        assert pitch_mask(range(2, 5)) == 0b11100
+        assert pitch_mask(range(-3, 2)) == 0b11
+        assert pitch_mask(range(120, 140)) == pitch_mask(list(range(120, 128)))
+        assert pitch_mask(range(0, 10, 3)) == pitch_mask([0, 3, 6, 9])
+        assert pitch_mask([]) == 0
+
+    def test_random_bit(self):
+        rng = random.Random(1)
+        mask = pitch_mask([3, 60, 127])
+        seen = set(_random_bit(mask, rng) for i in range(100))
+        assert seen == {3, 60, 127}
+
+    def test_constraints_hold(self):
+        stats = {}
+        seq = random_walk_bitset(60, 64, [
+            constraint_in_set(scales.C_major),
+            constraint_no_leaps_more_than(3),
+            constraint_no_repeated_adjacent_notes()], stats=stats)
+        pitches = [e.pitches[0] for e in seq.events]
+        assert len(pitches) == 64
+        assert set(pitches).issubset(scales.C_major)
+        assert all(0 < abs(a - b) <= 3 for (a, b) in zip(pitches, pitches[1:]))
+        assert stats["max_depth"] == 63
+
+    def test_forward_checking(self):
+        stats = {}
+        seq = random_walk_bitset(60, 6, [
+            constraint_no_leaps_more_than(2),
+            constraint_note_is(tick=1, pitch=64)], stats=stats)
+        assert [e.pitches[0] for e in seq.events][:3] == [60, 62, 64]
+        # notes other than 62 at tick 0 are rejected before going on
+        assert stats["backtracks"] == 0
+        assert stats["nodes"] == 5 + stats["forward_pruned"]
+
+    def test_opaque_constraints(self):
+        odd = lambda context: context[0] % 2 == 1
+        seq = random_walk_bitset(60, 10, [constraint_no_leaps_more_than(3), odd])
+        assert all(e.pitches[0] % 2 == 1 for e in seq.events[1:])
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(UnsatisfiableException):
+            random_walk_bitset(60, 8, [
+                constraint_no_leaps_more_than(1),
+                constraint_note_is(tick=3, pitch=70)])
@@ -1,7 +1,17 @@
+import gc
+import io
+import os
+import pickle
+import tempfile
 import unittest
 
+import mido
+
 from composerstoolkit import (CTEvent, CTSequence, CTGenerator,
-chain, NotChainableException, midievent, Container, permutate)
+chain, NotChainableException, midievent, Container, permutate,
+ColumnarEvents, set_history_policy, NoHistory, KeepLast, WeakHistory,
+DeltaHistory, transpose, loop, rotate, retrograde, CTStream, EventRope,
+EventView)
 
 class CTEventTests(unittest.TestCase):
     
@@ -45,6 +55,38 @@ class CTEventTests(unittest.TestCase):
         cte1 = CTEvent(1,600)
         cte2 = CTEvent(2,400)
         assert cte1 != cte2
+        
+    def test_pitches_cannot_be_mutated(self):
+        cte = CTEvent([60,64],100)
+        with self.assertRaises(AttributeError):
+            cte.pitches.append(67)
+        assert cte.pitches == [60,64]
+        assert cte.pitches is cte.pitches
+        assert cte.pitches == (60,64)
+        
+    def test_ctevent_is_hashable(self):
+        events = {CTEvent([60,64],100), CTEvent((60,64),100), CTEvent(60,100)}
+        assert len(events) == 2
+        assert hash(CTEvent(60,100)) == hash(CTEvent([60],100.0))
+        
+    def test_ctevent_unpacking(self):
+        pitches, duration = CTEvent(60,100)
+        assert pitches == [60]
+        assert duration == 100
+        assert CTEvent(60,100) == ([60], 100)
+        
+    def test_ctevent_interning(self):
+        cte1 = CTEvent.interned([60,64],100)
+        cte2 = CTEvent.interned((60,64),100)
+        assert cte1 is cte2
+        assert cte1 == CTEvent([60,64],100)
+        assert CTEvent.interned(60,100) is not CTEvent.interned(60,100.0)
+        assert CTEvent.interned(60,100) is not CTEvent.interned(60.0,100)
+        assert type(CTEvent.interned(60.0,100).pitches[0]) is float
+        
+    def test_ctevent_pickle(self):
+        cte = CTEvent([60,64],100)
+        assert pickle.loads(pickle.dumps(cte)) == cte
     
     
 class CTSequenceTests(unittest.TestCase):
@@ -127,6 +169,30 @@ class CTSequenceTests(unittest.TestCase):
             CTEvent(60,100),
             CTEvent(64,100)]
             
+    def test_slices_are_views(self):
+        events = [CTEvent(p,100) for p in range(60, 72)]
+        cts = CTSequence(EventView(events))
+        sliced = cts[2:10][::2][1:]
+        assert isinstance(sliced.events, EventView)
+        assert sliced.events.base is cts.events.base
+        assert sliced.events == events[2:10][::2][1:]
+        assert sliced.memento.events == events[2:10][::2]
+
+    def test_slices_of_lists_are_lists(self):
+        events = [CTEvent(p,100) for p in range(60, 72)]
+        sliced = CTSequence(events)[0:4]
+        assert isinstance(sliced.events, list)
+        sliced.events.append(CTEvent(72, 100))
+        assert len(sliced.events) == 5
+        assert len(events) == 12
+
+    def test_views_do_not_see_later_changes(self):
+        events = [CTEvent(p,100) for p in range(60, 64)]
+        reversed_events = EventView.of(events).reversed()
+        events[0] = CTEvent(48, 100)
+        events.append(CTEvent(72, 100))
+        assert reversed_events == [CTEvent(p,100) for p in [63, 62, 61, 60]]
+        
     def test_to_midi_events(self):
         cts = CTSequence([
             CTEvent(60,100),
@@ -145,6 +211,25 @@ class CTSequenceTests(unittest.TestCase):
             midievent(pitch=60, type="NOTE_ON", time=300),
             midievent(pitch=60, type="NOTE_OFF", time=400)]
             
+    def test_to_midi_events_chords_and_zero_durations(self):
+        cts = CTSequence([
+            CTEvent([60,64],100),
+            CTEvent([62,65],0),
+            CTEvent(67,50)])
+            
+        midi = cts.to_midi_events()
+        assert midi == [
+            midievent(pitch=60, type="NOTE_ON", time=0),
+            midievent(pitch=64, type="NOTE_ON", time=0),
+            midievent(pitch=60, type="NOTE_OFF", time=100),
+            midievent(pitch=64, type="NOTE_OFF", time=100),
+            midievent(pitch=62, type="NOTE_ON", time=100),
+            midievent(pitch=62, type="NOTE_OFF", time=100),
+            midievent(pitch=65, type="NOTE_ON", time=100),
+            midievent(pitch=65, type="NOTE_OFF", time=100),
+            midievent(pitch=67, type="NOTE_ON", time=100),
+            midievent(pitch=67, type="NOTE_OFF", time=150)]
+            
     def test_lookup(self):
         cts = CTSequence([
             CTEvent(60,100),
@@ -161,6 +246,40 @@ class CTSequenceTests(unittest.TestCase):
         assert cts.lookup(400) == CTEvent(60,100)
         assert cts.lookup(401) == None
         
+    def test_lookup_after_events_grow(self):
+        cts = CTSequence([CTEvent(60,100)])
+        assert cts.lookup(150) == None
+        cts.events.append(CTEvent(62,100))
+        assert cts.lookup(150) == CTEvent(62,100)
+        
+    def test_lookup_after_events_are_reassigned(self):
+        cts = CTSequence([CTEvent(60,1), CTEvent(62,1)])
+        for i in range(20):
+            assert cts.lookup(5) == None
+            # free the list, so that the next may well reuse its id
+            cts.events = []
+            cts.events = [CTEvent(60,5), CTEvent(62,5)]
+            assert cts.lookup(5) == CTEvent(60,5)
+            assert cts.lookup(10) == CTEvent(62,5)
+            cts.events = []
+            cts.events = [CTEvent(60,1), CTEvent(62,1)]
+        
+    def test_lookup_range(self):
+        cts = CTSequence([
+            CTEvent(60,100),
+            CTEvent(62,100),
+            CTEvent(64,100),
+            CTEvent(65,100)])
+            
+        assert cts.lookup_range(0, 100) == [CTEvent(60,100)]
+        assert cts.lookup_range(50, 250) == [
+            CTEvent(60,100),
+            CTEvent(62,100),
+            CTEvent(64,100)]
+        assert cts.lookup_range(301, 1000) == [CTEvent(65,100)]
+        assert cts.lookup_range(401, 1000) == []
+        assert cts.lookup_range(-10, -1) == []
+        
     def test_sequence_to_pitch_Set(self):
         cts = CTSequence([
             CTEvent(67,100),
@@ -190,6 +309,244 @@ class CTSequenceTests(unittest.TestCase):
         assert cts.pitches == [67,60,62,64,60]
         assert cts.durations == [100,100,200,100,100]
        
+    def test_equality_by_content(self):
+        cts1 = CTSequence([CTEvent(60,100), CTEvent([62,67],1)])
+        cts2 = CTSequence([CTEvent(60,100.0), CTEvent([62,67],1.0)], cts1)
+        assert cts1 == cts2
+        assert cts1.digest() == cts2.digest()
+        assert hash(cts1) == hash(cts2)
+        assert cts1 != CTSequence([CTEvent(60,100), CTEvent([67,62],1)])
+        assert cts1 != CTSequence([CTEvent(60,100)])
+        assert cts1 != cts1.events
+        assert cts1 == cts1.to_columnar()
+        
+    def test_digest_is_stable(self):
+        cts = CTSequence([CTEvent(60,1), CTEvent(None,0.5)])
+        assert cts.digest() == "2941eebebc7066cbb650dd49726ba288"
+        
+    def test_sequences_as_keys(self):
+        seen = {}
+        for pitch in [60, 62, 60, 64, 62]:
+            seen.setdefault(CTSequence([CTEvent(pitch,1)]), pitch)
+        assert len(seen) == 3
+        assert CTSequence([CTEvent(64,1)]) in seen
+        
+    def test_digest_is_incremental(self):
+        events = [CTEvent(60,1), CTEvent(62,1)]
+        cts = CTSequence(events)
+        digest = cts.digest()
+        events.append(CTEvent(64,1))
+        assert cts.digest() != digest
+        assert cts.digest() == CTSequence(events[:]).digest()
+        cts.events = events[:2]
+        assert cts.digest() == digest
+        
+    def test_digest_after_events_are_reassigned(self):
+        cts = CTSequence([CTEvent(71,1), CTEvent(71,1)])
+        for i in range(20):
+            digest = cts.digest()
+            # free the list, so that the next may well reuse its id
+            cts.events = []
+            cts.events = [CTEvent(60,1), CTEvent(62,1)]
+            assert cts.digest() != digest
+            assert cts == CTSequence([CTEvent(60,1), CTEvent(62,1)])
+            cts.events = []
+            cts.events = [CTEvent(71,1), CTEvent(71,1)]
+        
+    def test_equality_after_events_are_replaced(self):
+        cts = CTSequence([CTEvent(60,1), CTEvent(62,1)])
+        other = CTSequence([CTEvent(60,1), CTEvent(62,1)])
+        assert cts == other
+        # the cached digest is now stale
+        cts.events[1] = CTEvent(64,1)
+        assert cts != other
+        
+    def test_pickle_after_hashing(self):
+        cts = CTSequence([CTEvent(60,1)])
+        hash(cts)
+        assert pickle.loads(pickle.dumps(cts)) == cts
+        
+class ColumnarSequenceTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.events = [
+            CTEvent(67,100),
+            CTEvent([60,64],100),
+            CTEvent(None,200),
+            CTEvent(62,50)]
+        self.cts = CTSequence(self.events).to_columnar()
+    
+    def test_columnar_storage(self):
+        columns = self.cts.events
+        assert isinstance(columns, ColumnarEvents)
+        assert columns.pitch_array.tolist() == [67,60,64,62]
+        assert columns.offsets.tolist() == [0,1,3,3,4]
+        assert columns.duration_array.tolist() == [100,100,200,50]
+        
+    def test_columnar_events_compare_to_list(self):
+        assert self.cts.events == self.events
+        assert list(self.cts.events) == self.events
+        assert self.cts.events[1] == CTEvent([60,64],100)
+        assert self.cts.events[-1] == CTEvent(62,50)
+        
+    def test_columnar_pitches_and_durations(self):
+        assert self.cts.pitches == [67,60,64,62]
+        assert self.cts.durations == [100,100,200,50]
+        assert self.cts.to_pitch_set() == {60,62,64,67}
+        assert self.cts.to_pitch_class_set() == {0,2,4,7}
+        
+    def test_columnar_slicing(self):
+        assert self.cts[1].events == [CTEvent([60,64],100)]
+        assert self.cts[1:3].events == self.events[1:3]
+        assert self.cts[1:].pitches == [60,64,62]
+        assert self.cts[0:4:2].events == [CTEvent(67,100), CTEvent(None,200)]
+        assert self.cts[::-1].events == self.events[::-1]
+        assert (self.cts |chain| retrograde()).events == self.events[::-1]
+        assert (self.cts |chain| rotate(3)).events == self.events[3:] + self.events[:3]
+        
+    def test_columnar_to_midi_events(self):
+        assert self.cts.to_midi_events() == CTSequence(self.events).to_midi_events()
+        
+    def test_columnar_concatenation(self):
+        joined = self.cts.events + self.cts.events
+        assert isinstance(joined, ColumnarEvents)
+        assert joined == self.events + self.events
+        assert self.events + self.cts.events == self.events + self.events
+        
+class EventRopeTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.cell = [CTEvent(60,1), CTEvent(62,1), CTEvent(64,2)]
+        
+    def test_sequence_addition(self):
+        cts = CTSequence(self.cell[:1])
+        expected = self.cell[:1]
+        for i in range(200):
+            cts = cts + CTSequence(self.cell)
+            expected = expected + self.cell
+        assert isinstance(cts.events, EventRope)
+        assert cts.events == expected
+        assert cts.events[1:5] == expected[1:5]
+        assert cts.events[-1] == CTEvent(64,2)
+        assert cts.events.depth < 10
+        
+    def test_addition_does_not_alias_lists(self):
+        events = self.cell[:]
+        cts = CTSequence(events) + CTSequence(events)
+        events.append(CTEvent(0,1))
+        assert len(cts.events) == 6
+        
+    def test_repeat(self):
+        rope = EventRope.from_events(self.cell)
+        assert rope.repeat(0) == []
+        assert rope.repeat(5) == self.cell * 5
+        big = rope.repeat(10 ** 6)
+        assert len(big) == 3 * 10 ** 6
+        assert big[3 * 10 ** 6 - 1] == CTEvent(64,2)
+        assert big.depth < 40
+        with self.assertRaises(ValueError):
+            rope.repeat(-1)
+            
+    def test_columnar_leaves(self):
+        columnar = ColumnarEvents.from_events(self.cell)
+        rope = EventRope.concat(columnar, self.cell)
+        assert rope == self.cell + self.cell
+        
+    def test_sums_can_be_changed(self):
+        a = CTSequence(self.cell)
+        b = a + a
+        c = b + a
+        b.events.append(CTEvent(0,1))
+        b.events[0] = CTEvent(72,1)
+        del b.events[1]
+        assert b.events == [CTEvent(72,1)] + self.cell[2:] + self.cell + [CTEvent(0,1)]
+        assert b.events[-1] == CTEvent(0,1)
+        assert a.events == self.cell
+        assert c.events == self.cell * 3
+        # and can be shared again, once changed
+        d = b + a
+        b.events.append(CTEvent(1,1))
+        assert d.events == [CTEvent(72,1)] + self.cell[2:] + self.cell + [CTEvent(0,1)] + self.cell
+        assert b.events.depth == 0
+        
+    def test_loops_can_be_changed(self):
+        cts = CTSequence(self.cell) |chain| loop(3)
+        looped = cts |chain| loop(2)
+        cts.events[4] = CTEvent(None,1)
+        cts.events.extend(self.cell)
+        assert cts.events == self.cell + [self.cell[0], CTEvent(None,1)] + self.cell[2:] + self.cell * 2
+        assert looped.events == self.cell * 6
+        
+    def test_lookup_and_pitches(self):
+        cts = CTSequence(self.cell) + CTSequence(self.cell)
+        assert cts.lookup(5.5) == CTEvent(62,1)
+        assert cts.pitches == [60,62,64,60,62,64]
+        
+class HistoryTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.src = CTSequence([
+            CTEvent(60,100),
+            CTEvent(62,100),
+            CTEvent(64,100)])
+            
+    def tearDown(self):
+        set_history_policy(None)
+            
+    def build_chain(self, n=5):
+        seqs = [self.src]
+        for i in range(n):
+            seqs.append(seqs[-1] |chain| transpose(1))
+        return seqs
+    
+    def test_default_keeps_everything(self):
+        seqs = self.build_chain()
+        assert list(seqs[-1].history()) == seqs[-2::-1]
+        
+    def test_no_history(self):
+        set_history_policy(NoHistory())
+        seqs = self.build_chain()
+        assert seqs[-1].memento is None
+        assert list(seqs[-1].history()) == []
+        
+    def test_keep_last(self):
+        set_history_policy(KeepLast(2))
+        seqs = self.build_chain()
+        assert list(seqs[-1].history()) == [seqs[-2], seqs[-3]]
+        assert seqs[-3].memento is None
+        
+    def test_weak_history(self):
+        set_history_policy(WeakHistory())
+        seqs = self.build_chain(2)
+        assert seqs[-1].memento is seqs[-2]
+        del seqs[1]
+        gc.collect()
+        assert seqs[-1].memento is None
+        
+    def test_delta_history(self):
+        set_history_policy(DeltaHistory(snapshot_every=3))
+        seqs = self.build_chain(4)
+        seqs.append(seqs[-1] |chain| loop(3))
+        seqs.append(seqs[-1][2:5])
+        seqs.append(seqs[-1] |chain| rotate())
+        ancestors = list(seqs[-1].history())
+        assert len(ancestors) == len(seqs) - 1
+        for rebuilt, original in zip(ancestors, seqs[-2::-1]):
+            assert rebuilt.events == original.events
+            
+    def test_delta_history_limit(self):
+        set_history_policy(DeltaHistory(limit=3))
+        seqs = self.build_chain()
+        ancestors = list(seqs[-1].history())
+        assert [a.events for a in ancestors] == [s.events for s in seqs[-2:-5:-1]]
+        
+    def test_trim_history(self):
+        seqs = self.build_chain()
+        seqs[-1].trim_history(1)
+        assert list(seqs[-1].history()) == [seqs[-2]]
+        seqs[-1].trim_history()
+        assert seqs[-1].memento is None
+        
 class PermutationsTests(unittest.TestCase):
     
     def test_permutate_single_generations(self):
@@ -291,4 +648,104 @@ class ContainerTests(unittest.TestCase):
             midievent(pitch=60, type='NOTE_OFF', time=150),
             midievent(pitch=55, type='NOTE_ON', time=150),
             midievent(pitch=62, type='NOTE_OFF', time=200),
-            midievent(pitch=55, type='NOTE_OFF', time=250)]
\ No newline at end of file
+            midievent(pitch=55, type='NOTE_OFF', time=250)]
+            
+    def test_playback_rate(self):
+        container = Container(playback_rate=2)
+        container.add_sequence(0, CTSequence([CTEvent(60,100)]))
+        assert container.get_playback_events() == [
+            midievent(pitch=60, type='NOTE_ON', time=0),
+            midievent(pitch=60, type='NOTE_OFF', time=50)]
+            
+    def test_playback_events_are_lazy(self):
+        def forever():
+            while True:
+                yield CTEvent(60,100)
+        container = Container()
+        container.add_sequence(0, CTStream(forever()))
+        container.add_sequence(50, CTSequence([CTEvent(72,100)]))
+        events = container.iter_playback_events()
+        assert [next(events) for i in range(4)] == [
+            midievent(pitch=60, type='NOTE_ON', time=0),
+            midievent(pitch=72, type='NOTE_ON', time=50),
+            midievent(pitch=60, type='NOTE_OFF', time=100),
+            midievent(pitch=60, type='NOTE_ON', time=100)]
+
+class MidiFileTests(unittest.TestCase):
+
+    def read(self, container):
+        outf = io.BytesIO()
+        container.save_as_midi_file(outf)
+        outf.seek(0)
+        return mido.MidiFile(file=outf)
+
+    def test_tempo_and_tracks(self):
+        container = Container(bpm=90)
+        container.add_sequence(0, CTSequence([CTEvent(60,1), CTEvent(62,0.5)]))
+        container.add_sequence(2, CTSequence([CTEvent([48,55],2)]), channel_no=3)
+        midi = self.read(container)
+        assert midi.type == 1
+        assert midi.ticks_per_beat == 960
+        assert len(midi.tracks) == 3
+        tempo = [m for m in midi.tracks[0] if m.type == "set_tempo"]
+        assert tempo[0].tempo == mido.bpm2tempo(90)
+        assert midi.tracks[1].name == "Channel 0"
+        assert [(m.type, m.channel, m.note, m.time) for m in midi.tracks[1]
+            if not m.is_meta] == [
+                ("note_on", 0, 60, 0),
+                ("note_off", 0, 60, 960),
+                ("note_on", 0, 62, 0),
+                ("note_off", 0, 62, 480)]
+        assert [(m.type, m.channel, m.note, m.time) for m in midi.tracks[2]
+            if not m.is_meta] == [
+                ("note_on", 3, 48, 1920),
+                ("note_on", 3, 55, 0),
+                ("note_off", 3, 48, 1920),
+                ("note_off", 3, 55, 0)]
+
+    def test_running_status(self):
+        container = Container()
+        container.add_sequence(0, CTSequence([CTEvent([60,64,67],1)]))
+        outf = io.BytesIO()
+        container.save_as_midi_file(outf)
+        data = outf.getvalue()
+        # one status byte for each run of note-ons and of note-offs
+        assert data.count(bytes([0x90])) == 1
+        assert data.count(bytes([0x80])) == 1
+
+    def test_long_delta_times(self):
+        container = Container()
+        container.add_sequence(0, CTSequence([CTEvent(None,1000), CTEvent(60,1)]))
+        midi = self.read(container)
+        notes = [m for m in midi.tracks[1] if not m.is_meta]
+        assert notes[0].time == 960000
+
+    def test_float_pitches_and_dynamic(self):
+        container = Container()
+        container.add_sequence(0, CTSequence([CTEvent(60.0,1), CTEvent(61.6,1)]))
+        outf = io.BytesIO()
+        container.save_as_midi_file(outf, dynamic=80.0)
+        outf.seek(0)
+        midi = mido.MidiFile(file=outf)
+        assert [(m.type, m.note, m.velocity) for m in midi.tracks[1]
+            if not m.is_meta] == [
+                ("note_on", 60, 80),
+                ("note_off", 60, 0),
+                ("note_on", 62, 80),
+                ("note_off", 62, 0)]
+
+    def test_pitch_out_of_range(self):
+        container = Container()
+        container.add_sequence(0, CTSequence([CTEvent(127.6,1)]))
+        with self.assertRaises(ValueError):
+            container.save_as_midi_file(io.BytesIO())
+
+    def test_save_to_filename(self):
+        container = Container()
+        container.add_sequence(0, CTSequence([CTEvent(60,1)]))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "test.mid")
+            container.save_as_midi_file(filename)
+            midi = mido.MidiFile(filename)
+        assert [m.type for m in midi.tracks[1] if not m.is_meta] == [
+            "note_on", "note_off"]
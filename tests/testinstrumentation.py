@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import unittest
+
+from composerstoolkit import (CTEvent, CTSequence, chain, transpose,
+retrograde, loop, invert, Profiler, set_profiler)
+
+class ProfilerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.src = CTSequence([CTEvent(60,1), CTEvent(62,1), CTEvent(64,1)])
+
+    def test_records_each_transformer(self):
+        with Profiler() as profiler:
+            self.src |chain| transpose(2) |chain| loop(2) |chain| transpose(1)
+        stats = profiler.stats
+        assert set(stats.keys()) == {"transpose", "loop"}
+        assert stats["transpose"].calls == 2
+        assert stats["transpose"].events_in == 3 + 6
+        assert stats["loop"].events_out == 6
+        assert stats["loop"].total_time > 0
+        assert [s.name for s in profiler.rows()] != []
+        assert "transpose" in profiler.table()
+
+    def test_plain_functions(self):
+        def double_up(seq):
+            return [CTEvent(e.pitches, e.duration) for e in seq.events] * 2
+        with Profiler() as profiler:
+            self.src |chain| double_up
+        assert profiler.stats["double_up"].events_out == 6
+
+    def test_fused_stages(self):
+        with Profiler() as profiler:
+            result = self.src.lazy() |chain| transpose(2) |chain| invert()
+            result.events
+        assert list(profiler.stats.keys()) == ["fused(transpose, invert)"]
+
+    def test_memory(self):
+        with Profiler(trace_memory=True) as profiler:
+            self.src |chain| loop(1000) |chain| transpose(1)
+        assert profiler.stats["transpose"].allocated_bytes > 0
+
+    def test_chrome_trace(self):
+        with Profiler() as profiler:
+            self.src |chain| transpose(2) |chain| retrograde()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "trace.json")
+            profiler.save_chrome_trace(filename)
+            with open(filename) as inf:
+                trace = json.load(inf)
+        events = trace["traceEvents"]
+        assert [e["name"] for e in events] == ["transpose", "retrograde"]
+        assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+        assert events[0]["args"]["events_out"] == 3
+
+    def test_uninstalled_on_exit(self):
+        with Profiler() as profiler:
+            pass
+        self.src |chain| transpose(2)
+        assert profiler.stats == {}
+        assert set_profiler(None) is None
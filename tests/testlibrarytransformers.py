@@ -2,7 +2,9 @@ import unittest
     
 from composerstoolkit import (CTEvent, CTSequence, chain, boolean_gate,
 loop, transpose, invert, retrograde, rhythmic_augmentation, aggregate_into_chords,
-rhythmic_diminution, explode_intervals, rotate, map_to_pulses, map_to_pitches)
+rhythmic_diminution, explode_intervals, rotate, map_to_pulses, map_to_pitches,
+ColumnarEvents, CTTransformer, LazySequence, TransformCache,
+set_transform_cache, EventView)
 
 class CTLibraryTransformerTests(unittest.TestCase):
     
@@ -71,6 +73,55 @@ class CTLibraryTransformerTests(unittest.TestCase):
             CTEvent(62,100),
         ]
     
+    def test_rotate_is_a_view(self):
+        src = CTSequence([CTEvent(i % 100, 1) for i in range(10000)])
+        rotated = src |chain| rotate(5001)
+        assert isinstance(rotated.events, EventView)
+        assert rotated.events[0] == CTEvent(1, 1)
+        assert rotated.events[-1] == CTEvent(0, 1)
+        assert rotated.events == src.events[5001:] + src.events[:5001]
+        # rotating a view composes with it
+        twice = rotated |chain| rotate(4999)
+        assert twice.events.base is rotated.events.base
+        assert twice.events == src.events
+
+    def test_results_do_not_alias_the_source(self):
+        src = CTSequence([CTEvent(60,100), CTEvent(62,100), CTEvent(64,100)])
+        backwards = src |chain| retrograde()
+        rotated = src |chain| rotate()
+        src.events[0] = CTEvent(48,100)
+        src.events.append(CTEvent(72,100))
+        assert backwards.events == [CTEvent(64,100), CTEvent(62,100), CTEvent(60,100)]
+        assert rotated.events == [CTEvent(62,100), CTEvent(64,100), CTEvent(60,100)]
+        
+    def test_results_can_be_changed(self):
+        src = CTSequence([CTEvent(60,100), CTEvent(62,100), CTEvent(64,100)])
+        backwards = src |chain| retrograde()
+        rotated = src |chain| rotate()
+        both = rotated |chain| retrograde()
+        backwards.events.append(CTEvent(72,100))
+        rotated.events[0] = CTEvent(48,100)
+        assert backwards.events == [CTEvent(64,100), CTEvent(62,100),
+            CTEvent(60,100), CTEvent(72,100)]
+        assert rotated.events == [CTEvent(48,100), CTEvent(64,100), CTEvent(60,100)]
+        assert src.events == [CTEvent(60,100), CTEvent(62,100), CTEvent(64,100)]
+        assert both.events == [CTEvent(60,100), CTEvent(64,100), CTEvent(62,100)]
+        # a changed view is viewed as it is now
+        assert (rotated |chain| retrograde()).events == [
+            CTEvent(60,100), CTEvent(64,100), CTEvent(48,100)]
+        assert (backwards |chain| rotate()).events == [CTEvent(62,100),
+            CTEvent(60,100), CTEvent(72,100), CTEvent(64,100)]
+        
+    def test_retrograde_of_rotation(self):
+        rotated = self.src |chain| rotate() |chain| retrograde()
+        assert rotated.events == [
+            CTEvent(60,100),
+            CTEvent(60,100),
+            CTEvent(64,100),
+            CTEvent(62,100),
+        ]
+        assert rotated.events.materialize() == list(rotated.events)
+        
     def test_transpose(self):
         transposed = self.src |chain| transpose(1)
         assert transposed.events == [
@@ -283,6 +334,28 @@ class CTLibraryTransformerTests(unittest.TestCase):
             CTEvent(60,100),
         ]
         
+    def test_gated_transformer_uneven_durations(self):
+        input = CTSequence([
+            CTEvent(60,50),
+            CTEvent(60,150),
+            CTEvent(60,100),
+            CTEvent(60,50),
+            CTEvent(60,50),
+        ])
+        gate = CTSequence([
+            CTEvent(None,100),
+            CTEvent(1,200),
+            CTEvent(None,200),
+        ])
+        transformed = input |chain| transpose(1, gate=boolean_gate(gate))
+        assert transformed.events == [
+            CTEvent(60,50),
+            CTEvent(61,150),
+            CTEvent(61,100),
+            CTEvent(60,50),
+            CTEvent(60,50),
+        ]
+        
     def test_i_can_compose_transformers(self):
         transformed = self.src.chain(transpose(1)).chain(transpose(1))
         assert transformed.events == [
@@ -309,3 +382,205 @@ class CTLibraryTransformerTests(unittest.TestCase):
             CTEvent([63, 64, 65], 1), 
             CTEvent([66, 67], 1)
         ]
+        
+class ColumnarTransformerTests(unittest.TestCase):
+    """the array-based fast paths must give the same results as the
+    list-based implementations
+    """
+    
+    def setUp(self):
+        self.src = CTSequence([
+            CTEvent([60,67],100),
+            CTEvent(62,50),
+            CTEvent(58,100),
+            CTEvent(65,0),
+            CTEvent(71,25),
+        ])
+        
+    def assert_same(self, transformer, src=None):
+        if src is None:
+            src = self.src
+        expected = src |chain| transformer
+        transformed = src.to_columnar() |chain| transformer
+        assert isinstance(transformed.events, ColumnarEvents)
+        assert transformed.events == expected.events
+        assert str(list(transformed.events)) == str(expected.events)
+        
+    def test_transpose(self):
+        self.assert_same(transpose(3))
+        self.assert_same(transpose(-12))
+        
+    def test_invert(self):
+        self.assert_same(invert())
+        self.assert_same(invert(64))
+        
+    def test_explode_intervals(self):
+        self.assert_same(explode_intervals(2))
+        self.assert_same(explode_intervals(2, "linear"))
+        self.assert_same(explode_intervals(0.5))
+        self.assert_same(explode_intervals(1.5, "linear"))
+        self.assert_same(explode_intervals(2), self.src[0])
+        with self.assertRaises(Exception) as context:
+            self.src.to_columnar() |chain| explode_intervals(2, "---")
+        
+    def test_rhythmic_augmentation_and_diminution(self):
+        self.assert_same(rhythmic_augmentation(2))
+        self.assert_same(rhythmic_augmentation(0.5))
+        self.assert_same(rhythmic_diminution(2))
+        self.assert_same(rhythmic_diminution(3))
+        
+    def test_aggregate_into_chords(self):
+        self.assert_same(aggregate_into_chords(2))
+        self.assert_same(aggregate_into_chords(3, 4))
+        self.assert_same(aggregate_into_chords(5))
+        self.assert_same(aggregate_into_chords(2), CTSequence([]))
+        
+    def test_map_to_pitches(self):
+        pitches = CTSequence([CTEvent(72,1), CTEvent([74,50],1)])
+        self.assert_same(map_to_pitches(pitches))
+        self.assert_same(map_to_pitches(pitches.to_columnar()))
+        self.assert_same(map_to_pitches(self.src))
+        
+class LazyChainTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.src = CTSequence([
+            CTEvent([60,67],100),
+            CTEvent(62,50),
+            CTEvent(58,100),
+            CTEvent(65,25),
+        ])
+        self.pulses = CTSequence([
+            CTEvent(None,10),
+            CTEvent(None,20),
+            CTEvent(None,30),
+        ])
+        self.pipeline = [
+            transpose(2),
+            transpose(-5),
+            rhythmic_augmentation(3),
+            invert(),
+            transpose(1),
+            invert(60),
+            map_to_pulses(self.pulses),
+            retrograde(),
+            rhythmic_diminution(2),
+            map_to_pitches(self.src),
+            transpose(12),
+        ]
+        
+    def run_eager(self, seq):
+        for t in self.pipeline:
+            seq = seq |chain| t
+        return seq
+        
+    def run_lazy(self, seq):
+        seq = seq.lazy()
+        for t in self.pipeline:
+            seq = seq |chain| t
+        return seq
+    
+    def test_lazy_chain_matches_eager_chain(self):
+        lazy = self.run_lazy(self.src)
+        assert isinstance(lazy, LazySequence)
+        assert not lazy.evaluated
+        assert lazy.events == self.run_eager(self.src).events
+        assert lazy.evaluated
+        
+    def test_lazy_chain_on_columnar_sequence(self):
+        lazy = self.run_lazy(self.src.to_columnar())
+        assert lazy.events == self.run_eager(self.src).events
+        
+    def test_lazy_chain_stages(self):
+        lazy = self.run_lazy(self.src)
+        stages = lazy.stages()
+        assert stages[0] == self.pipeline[0:7]
+        assert stages[1] is self.pipeline[7]
+        assert stages[2] == self.pipeline[8:]
+        
+    def test_lazy_chain_memento(self):
+        lazy = self.src.lazy() |chain| transpose(1)
+        lazy2 = lazy |chain| transpose(1)
+        assert lazy2.memento is lazy
+        assert lazy2.pitches == [62,69,64,60,67]
+        assert not lazy.evaluated
+        
+    def test_fused_steps_do_not_build_intermediates(self):
+        def no_intermediates(seq, interval):
+            raise AssertionError("the transformer itself should not be called")
+        shift = CTTransformer(no_intermediates)
+        shift.fuse_with(lambda first, interval: transpose.kernel(first, interval))
+        lazy = self.src.lazy() |chain| shift(1) |chain| shift(2) |chain| invert()
+        assert lazy.events == (self.src |chain| transpose(3) |chain| invert()).events
+        
+    def test_lazy_chain_with_empty_input(self):
+        lazy = CTSequence([]).lazy() |chain| transpose(1) |chain| retrograde()
+        assert lazy.events == []
+
+class TransformCacheTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.cache = TransformCache(maxsize=2)
+        self.previous = set_transform_cache(self.cache)
+        self.calls = []
+        @CTTransformer
+        def counted_transpose(seq, interval):
+            self.calls.append(interval)
+            return [CTEvent([p + interval for p in e.pitches], e.duration)
+                for e in seq.events]
+        self.counted_transpose = counted_transpose
+        self.src = CTSequence([CTEvent(60,1), CTEvent(62,1)])
+        
+    def tearDown(self):
+        set_transform_cache(self.previous)
+        
+    def test_hits_and_misses(self):
+        r1 = self.src |chain| self.counted_transpose(2)
+        # equal content, another object
+        r2 = CTSequence([CTEvent(60,1), CTEvent(62,1)]) |chain| self.counted_transpose(2)
+        assert r1.events == r2.events == [CTEvent(62,1), CTEvent(64,1)]
+        assert self.calls == [2]
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+        # cached results are copies
+        r1.events.append(CTEvent(0,1))
+        r3 = self.src |chain| self.counted_transpose(2)
+        assert r3.events == [CTEvent(62,1), CTEvent(64,1)]
+        
+    def test_lru_eviction(self):
+        for interval in [1, 2, 1, 3, 2, 1]:
+            self.src |chain| self.counted_transpose(interval)
+        # 2 was evicted by 3, then 1 by 2
+        assert self.calls == [1, 2, 3, 2, 1]
+        assert len(self.cache) == 2
+        
+    def test_impure_transformers_are_not_cached(self):
+        @CTTransformer.impure
+        def shuffle(seq):
+            self.calls.append("shuffle")
+            return seq.events[:]
+        self.src |chain| shuffle()
+        self.src |chain| shuffle()
+        assert self.calls == ["shuffle", "shuffle"]
+        assert len(self.cache) == 0
+        
+    def test_unhashable_arguments_bypass_the_cache(self):
+        @CTTransformer
+        def append(seq, events):
+            self.calls.append("append")
+            return seq.events + events
+        self.src |chain| append([CTEvent(1,1)])
+        self.src |chain| append([CTEvent(1,1)])
+        assert self.calls == ["append", "append"]
+        
+    def test_sequence_arguments(self):
+        pulses = CTSequence([CTEvent(None,2), CTEvent(None,3)])
+        r1 = self.src |chain| map_to_pulses(pulses)
+        r2 = self.src |chain| map_to_pulses(CTSequence([CTEvent(None,2), CTEvent(None,3)]))
+        assert r1.events == r2.events == [CTEvent(60,2), CTEvent(62,3)]
+        assert self.cache.hits == 1
+        
+    def test_disabled_by_default(self):
+        set_transform_cache(None)
+        self.src |chain| self.counted_transpose(2)
+        self.src |chain| self.counted_transpose(2)
+        assert self.calls == [2, 2]
@@ -0,0 +1,207 @@
+import asyncio
+import unittest
+
+from composerstoolkit import (CTEvent, CTSequence, Container, Scheduler,
+midievent, VirtualClock)
+
+class FakeClock():
+    """a clock that only advances when slept on, oversleeping by a
+    fixed amount each time"""
+
+    def __init__(self, oversleep=0.0):
+        self.time = 100.0
+        self.oversleep = oversleep
+        self.sleeps = []
+
+    def now(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.time = self.time + seconds + self.oversleep
+
+class FakePlayer():
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+
+    def noteon(self, channel, pitch, dynamic):
+        self.calls.append(("on", channel, pitch, self.clock.now()))
+
+    def noteoff(self, channel, pitch):
+        self.calls.append(("off", channel, pitch, self.clock.now()))
+
+class SchedulerTests(unittest.TestCase):
+
+    def test_oversleeping_does_not_accumulate(self):
+        clock = FakeClock(oversleep=0.01)
+        events = [(0, midievent(60, "NOTE_ON", t)) for t in range(1, 101)]
+        dispatched = []
+        stats = Scheduler(clock.now, clock.sleep).run(
+            events, lambda c, e: dispatched.append(clock.now()))
+        # each event is at most one oversleep late, never 100 of them
+        assert stats.count == 100
+        assert abs(stats.max_lateness - 0.01) < 1e-9
+        assert abs(dispatched[-1] - 200.01) < 1e-9
+
+    def test_one_wait_per_timestamp(self):
+        clock = FakeClock()
+        events = [
+            (0, midievent(60, "NOTE_ON", 0)),
+            (0, midievent(64, "NOTE_ON", 0)),
+            (0, midievent(60, "NOTE_OFF", 2)),
+            (0, midievent(64, "NOTE_OFF", 2)),
+        ]
+        dispatched = []
+        Scheduler(clock.now, clock.sleep).run(
+            events, lambda c, e: dispatched.append(e), seconds_per_beat=0.5)
+        assert clock.sleeps == [1.0]
+        assert [e.pitch for e in dispatched] == [60, 64, 60, 64]
+
+class ContainerPlaybackTests(unittest.TestCase):
+
+    def test_playback_honours_bpm_and_channels(self):
+        clock = FakeClock()
+        player = FakePlayer(clock)
+        container = Container(bpm=120)
+        container.add_sequence(0, CTSequence([CTEvent(60, 1), CTEvent(62, 1)]),
+            channel_no=1)
+        container.add_sequence(0, CTSequence([CTEvent(48, 2)]), channel_no=2)
+        stats = container.playback(player, clock=clock.now, sleep=clock.sleep)
+        assert player.calls == [
+            ("on", 1, 60, 100.0),
+            ("on", 2, 48, 100.0),
+            ("off", 1, 60, 100.5),
+            ("on", 1, 62, 100.5),
+            ("off", 1, 62, 101.0),
+            ("off", 2, 48, 101.0),
+        ]
+        assert stats.count == 6
+        assert stats.max_lateness == 0
+
+class AsyncPlaybackTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.player = FakePlayer(self.clock)
+        # one beat per second
+        self.container = Container(bpm=60)
+        self.container.add_sequence(0, CTSequence(
+            [CTEvent(60, 1), CTEvent(62, 1), CTEvent(64, 1), CTEvent(65, 1)]))
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_plays_to_the_end(self):
+        async def main():
+            playback = self.container.playback_async(self.player,
+                clock=self.clock).start()
+            await self.clock.advance(10)
+            return await playback
+        stats = self.run_async(main())
+        assert [c[2] for c in self.player.calls if c[0] == "on"] == [60, 62, 64, 65]
+        assert self.player.calls[-1] == ("off", 0, 65, 4.0)
+        assert stats.count == 8
+        assert stats.max_lateness == 0
+
+    def test_pause_and_resume(self):
+        async def main():
+            playback = self.container.playback_async(self.player,
+                clock=self.clock).start()
+            await self.clock.advance(1.5)
+            playback.pause()
+            await self.clock.advance(0)
+            assert playback.paused
+            assert playback.position == 1.5
+            # nothing happens while paused
+            n_calls = len(self.player.calls)
+            await self.clock.advance(100)
+            assert len(self.player.calls) == n_calls
+            playback.resume()
+            await self.clock.advance(10)
+            return await playback
+        self.run_async(main())
+        # 62 is silenced on pausing, and 64 sounds half a beat after resuming
+        assert ("off", 0, 62, 1.5) in self.player.calls
+        assert ("on", 0, 64, 102.0) in self.player.calls
+
+    def test_seek(self):
+        async def main():
+            playback = self.container.playback_async(self.player,
+                clock=self.clock).start()
+            await self.clock.advance(0.5)
+            playback.seek(3)
+            await self.clock.advance(10)
+            return await playback
+        self.run_async(main())
+        assert self.player.calls == [
+            ("on", 0, 60, 0.0),
+            ("off", 0, 60, 0.5),
+            ("on", 0, 65, 0.5),
+            ("off", 0, 65, 1.5),
+        ]
+
+    def test_stop(self):
+        async def main():
+            playback = self.container.playback_async(self.player,
+                clock=self.clock).start()
+            await self.clock.advance(1.5)
+            playback.stop()
+            await self.clock.advance(0)
+            assert playback.done
+            return await playback
+        stats = self.run_async(main())
+        assert self.player.calls[-1] == ("off", 0, 62, 1.5)
+        assert stats.count == 3
+
+    def test_concurrent_containers(self):
+        other = Container(bpm=120)
+        other.add_sequence(0, CTSequence([CTEvent(48, 1), CTEvent(50, 1)]),
+            channel_no=1)
+        async def main():
+            playbacks = [
+                self.container.playback_async(self.player, clock=self.clock),
+                other.playback_async(self.player, clock=self.clock)]
+            results = asyncio.gather(*[p.start() for p in playbacks])
+            await self.clock.advance(10)
+            return await results
+        self.run_async(main())
+        assert [c for c in self.player.calls if c[1] == 1] == [
+            ("on", 1, 48, 0.0),
+            ("off", 1, 48, 0.5),
+            ("on", 1, 50, 0.5),
+            ("off", 1, 50, 1.0),
+        ]
+
+class VirtualClockTests(unittest.TestCase):
+
+    def test_long_await_chains(self):
+        clock = VirtualClock()
+        times = []
+        async def sleeper():
+            for i in range(3):
+                await clock.sleep(1)
+                # far more steps than it takes to wake up
+                for j in range(50):
+                    await asyncio.sleep(0)
+                times.append(clock.now())
+        async def main():
+            task = asyncio.ensure_future(sleeper())
+            await clock.advance(10)
+            await task
+        asyncio.run(main())
+        assert times == [1.0, 2.0, 3.0]
+
+    def test_interrupt(self):
+        clock = VirtualClock()
+        async def main():
+            interrupt = asyncio.get_running_loop().create_future()
+            sleeping = asyncio.ensure_future(clock.sleep(5, interrupt))
+            await clock.advance(1)
+            interrupt.set_result(None)
+            assert await sleeping
+            slept, _ = await asyncio.gather(clock.sleep(1), clock.advance(1))
+            assert slept is False
+            assert clock.now() == 2.0
+        asyncio.run(main())
@@ -0,0 +1,95 @@
+import itertools
+import unittest
+
+from composerstoolkit import (CTEvent, CTSequence, CTStream, chain,
+stream_loop, stream_transpose, stream_retrograde, stream_map_to_pulses,
+stream_map_to_pitches, transpose, map_to_pulses, map_to_pitches,
+random_walk)
+
+def forever(pitch=60, duration=100):
+    # an infinite source of events
+    for i in itertools.count():
+        yield CTEvent(pitch + (i % 12), duration)
+
+class CTStreamTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.src = CTSequence([
+            CTEvent(60,100),
+            CTEvent(62,100),
+            CTEvent(64,100),
+            CTEvent(60,100),
+        ])
+        
+    def test_take(self):
+        stream = CTStream(forever())
+        assert stream.take(3).events == [
+            CTEvent(60,100),
+            CTEvent(61,100),
+            CTEvent(62,100)]
+        assert stream.take(1).events == [CTEvent(63,100)]
+        
+    def test_chain_is_lazy(self):
+        stream = CTStream(forever()) |chain| stream_transpose(2)
+        assert stream.memento is not None
+        assert stream.take(2).events == [CTEvent(62,100), CTEvent(63,100)]
+        
+    def test_stream_transpose_matches_transpose(self):
+        stream = CTStream(self.src.events) |chain| stream_transpose(-3)
+        assert list(stream) == (self.src |chain| transpose(-3)).events
+        
+    def test_stream_loop(self):
+        stream = CTStream(self.src.events) |chain| stream_loop(2)
+        assert list(stream) == self.src.events + self.src.events
+        stream = CTStream(self.src.events) |chain| stream_loop()
+        assert stream.take(10).events == (self.src.events * 3)[:10]
+        assert list(CTStream([]) |chain| stream_loop()) == []
+        with self.assertRaises(ValueError) as context:
+            CTStream(self.src.events) |chain| stream_loop(-1)
+            
+    def test_stream_retrograde(self):
+        stream = CTStream(self.src.events) |chain| stream_retrograde(3)
+        assert list(stream) == [
+            CTEvent(64,100),
+            CTEvent(62,100),
+            CTEvent(60,100),
+            CTEvent(60,100)]
+        stream = CTStream(forever()) |chain| stream_retrograde(2)
+        assert stream.take(4).pitches == [61,60,63,62]
+        
+    def test_stream_map_to_pulses(self):
+        pulses = CTSequence([CTEvent(None,10), CTEvent(None,20), CTEvent(None,30)])
+        stream = CTStream(self.src.events) |chain| stream_map_to_pulses(pulses)
+        assert list(stream) == (self.src |chain| map_to_pulses(pulses)).events
+        looped = CTStream(pulses.events) |chain| stream_loop()
+        stream = CTStream(forever()) |chain| stream_map_to_pulses(looped)
+        assert stream.take(4).durations == [10,20,30,10]
+        
+    def test_stream_map_to_pitches(self):
+        rhythm = CTSequence([CTEvent(None,d) for d in [100,200,300,400,500]])
+        stream = CTStream(rhythm.events) |chain| stream_map_to_pitches(self.src)
+        assert list(stream) == (rhythm |chain| map_to_pitches(self.src)).events
+        
+    def test_to_midi_events(self):
+        src = CTSequence([
+            CTEvent([60,64],100),
+            CTEvent(62,0),
+            CTEvent([65,67],0),
+            CTEvent(60,50),
+        ])
+        stream = CTStream(src.events)
+        assert list(stream.to_midi_events(10)) == src.to_midi_events(10)
+        
+    def test_midi_events_from_infinite_stream(self):
+        events = CTStream(forever()).to_midi_events()
+        first = list(itertools.islice(events, 4))
+        assert [(e.pitch, e.type, e.time) for e in first] == [
+            (60, "NOTE_ON", 0),
+            (60, "NOTE_OFF", 100),
+            (61, "NOTE_ON", 100),
+            (61, "NOTE_OFF", 200)]
+            
+    def test_stream_from_random_walk(self):
+        solver = random_walk(CTSequence([CTEvent(60,100)]), [(transpose(1), 1)])
+        stream = CTStream.concat(solver) |chain| stream_transpose(-1)
+        assert stream.take(3).pitches == [60,61,62]